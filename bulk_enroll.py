@@ -0,0 +1,143 @@
+"""
+Bulk enrollment from the command line.
+
+Usage:
+    python bulk_enroll.py staff.csv
+    python bulk_enroll.py staff_photos/      (reads staff_photos/users.csv)
+
+The CSV needs the columns: name, email, pin, photo
+Photo paths are resolved relative to the CSV file.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import db, face_auth
+
+MANIFEST_NAME = "users.csv"
+REQUIRED_COLUMNS = ("name", "email", "pin", "photo")
+
+def _init_worker():
+    # Each worker is already one of N processes; stop OpenCV from spawning its own threads on top.
+    import cv2
+    cv2.setNumThreads(1)
+
+def _encode_photo(photo_path):
+    """
+    Worker: reads a photo from disk and returns the face signature bytes (or None).
+    """
+    try:
+        with open(photo_path, "rb") as f:
+            return face_auth.get_face_encodings_from_image(f.read())
+    except OSError as e:
+        print(f"Photo Read Error ({photo_path}): {e}")
+        return None
+
+def load_records(source):
+    """
+    Reads (name, email, pin, photo_path) records from a CSV file or a directory holding users.csv.
+    Returns (records, errors) where errors is a list of human readable strings.
+    """
+    csv_path = os.path.join(source, MANIFEST_NAME) if os.path.isdir(source) else source
+    if not os.path.isfile(csv_path):
+        return [], [f"Manifest not found: {csv_path}"]
+
+    base_dir = os.path.dirname(os.path.abspath(csv_path))
+    records, errors, seen = [], [], set()
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        header = [h.strip().lower() for h in (reader.fieldnames or [])]
+        missing = [c for c in REQUIRED_COLUMNS if c not in header]
+        if missing:
+            return [], [f"Missing columns in {csv_path}: {', '.join(missing)}"]
+        reader.fieldnames = header
+
+        for line_no, row in enumerate(reader, start=2):
+            name = (row.get("name") or "").strip()
+            email = (row.get("email") or "").strip()
+            pin = (row.get("pin") or "").strip()
+            photo = (row.get("photo") or "").strip()
+
+            if not (name and email and pin and photo):
+                errors.append(f"Line {line_no}: empty field")
+                continue
+            if not pin.isdigit():
+                errors.append(f"Line {line_no}: PIN must be digits only")
+                continue
+            if email in seen:
+                errors.append(f"Line {line_no}: duplicate email {email}")
+                continue
+            seen.add(email)
+
+            photo_path = photo if os.path.isabs(photo) else os.path.join(base_dir, photo)
+            records.append((name, email, pin, photo_path))
+
+    return records, errors
+
+def enroll(records, workers=None, batch_size=500):
+    """
+    Encodes faces in a process pool and inserts users in batched transactions.
+    Returns (inserted, failed_records).
+    """
+    existing = db.get_all_emails()
+    todo = [r for r in records if r[1] not in existing]
+    skipped = len(records) - len(todo)
+    if skipped:
+        print(f"Skipping {skipped} already registered users.")
+
+    inserted = 0
+    failed = []
+    batch = []
+    # Small chunks keep every worker busy while still amortizing the pickling overhead.
+    n_workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(32, len(todo) // (n_workers * 4)))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        photos = [r[3] for r in todo]
+        for record, encoding in zip(todo, pool.map(_encode_photo, photos, chunksize=chunksize)):
+            if encoding is None:
+                failed.append(record)
+                continue
+            name, email, pin, _ = record
+            batch.append((name, email, pin, encoding))
+            if len(batch) >= batch_size:
+                inserted += db.add_users_bulk(batch)
+                print(f"Enrolled {inserted}/{len(todo)}...")
+                batch = []
+
+    if batch:
+        inserted += db.add_users_bulk(batch)
+
+    return inserted, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk enroll users with face photos into the Swar database.")
+    parser.add_argument("source", help="CSV file (name,email,pin,photo) or a directory containing users.csv")
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per insert transaction")
+    args = parser.parse_args(argv)
+
+    db.init_db()
+
+    records, errors = load_records(args.source)
+    for err in errors:
+        print(f"Skipped: {err}")
+    if not records:
+        print("No valid records to enroll.")
+        return 1
+
+    start = time.time()
+    inserted, failed = enroll(records, workers=args.workers, batch_size=args.batch_size)
+    elapsed = time.time() - start
+
+    for name, email, _, photo_path in failed:
+        print(f"No face found for {name} <{email}> in {photo_path}")
+    print(f"Enrolled {inserted} users in {elapsed:.1f}s ({len(failed)} without a usable face).")
+    return 0 if not failed else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
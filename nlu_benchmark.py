@@ -0,0 +1,201 @@
+"""
+Offline accuracy / latency benchmark for nlu.parse_command.
+
+Usage:
+    python nlu_benchmark.py
+    python nlu_benchmark.py --llm-latency 0.8 --llm-jitter 0.3 --passes 2
+    python nlu_benchmark.py --no-llm --json before.json
+
+google.generativeai is replaced by a deterministic stub before utils.nlu is imported, so no
+network or API key is needed. The stub answers with the labelled intent after a simulated
+delay (seeded), i.e. it behaves like a perfect but slow Gemini. What is measured is how many
+utterances each tier answers, how accurate the local tiers are, and what that costs in latency.
+
+The corpus (utils/data/nlu_benchmark.json) is a list of {"text", "intent", "params"} entries;
+"asr": true marks speech-recognition mishearings ("open send", "open email to", ...).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+import types
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils", "data", "nlu_benchmark.json")
+TIERS = ("grammar", "cache", "classifier", "llm", "fallback")
+
+class StubModel:
+    """
+    Stand-in for genai.GenerativeModel: answers parse prompts from the labelled corpus.
+    """
+
+    def __init__(self, answers, latency, jitter, error_rate, seed):
+        self.answers = answers
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def generate_content(self, prompt, request_options=None, stream=False):
+        self.calls += 1
+        delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        fail = self.rng.random() < self.error_rate
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("stub: simulated API error")
+        match = re.search(r'User: "(.*)"\s*JSON:', prompt, re.S)
+        key = match.group(1).strip().lower() if match else ""
+        answer = self.answers.get(key, {"intent": "unknown", "params": {}})
+        return types.SimpleNamespace(text="```json\n" + json.dumps(answer) + "\n```")
+
+def install_stub(model):
+    """
+    Registers a fake google.generativeai module whose GenerativeModel() returns model.
+    Must run before utils.nlu is imported.
+    """
+    stub = types.ModuleType("google.generativeai")
+    stub.configure = lambda **kwargs: None
+    stub.GenerativeModel = lambda name: model
+    google = sys.modules.get("google") or types.ModuleType("google")
+    google.generativeai = stub
+    sys.modules["google"] = google
+    sys.modules["google.generativeai"] = stub
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def is_correct(result, case):
+    """
+    Returns (intent_ok, params_ok). Expected params must all be present with the same value.
+    """
+    intent = (result or {}).get("intent") or "unknown"
+    if intent != case["intent"]:
+        return False, False
+    params = (result or {}).get("params") or {}
+    return True, all(params.get(k) == v for k, v in case["params"].items())
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+def run_pass(nlu, corpus, speculative=False):
+    """
+    Parses every utterance once. Returns one record per utterance.
+    """
+    records = []
+    for case in corpus:
+        before = nlu.get_tier_stats()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = nlu.parse_command(case["text"], speculative=speculative)
+        elapsed = time.perf_counter() - start
+        after = nlu.get_tier_stats()
+        tier = next((t for t in TIERS if after[t] != before[t]), "none")
+        intent_ok, params_ok = is_correct(result, case)
+        records.append({"text": case["text"], "expected": case["intent"], "asr": bool(case.get("asr")),
+                        "result": result, "tier": tier, "latency": elapsed,
+                        "intent_ok": intent_ok, "params_ok": params_ok})
+    return records
+
+def summarize(records):
+    def block(rows):
+        latencies = [r["latency"] for r in rows]
+        return {
+            "count": len(rows),
+            "intent_accuracy": sum(r["intent_ok"] for r in rows) / len(rows) if rows else None,
+            "full_accuracy": sum(r["params_ok"] for r in rows) / len(rows) if rows else None,
+            "p50_ms": _ms(percentile(latencies, 0.50)),
+            "p95_ms": _ms(percentile(latencies, 0.95)),
+            "p99_ms": _ms(percentile(latencies, 0.99)),
+        }
+
+    summary = {"overall": block(records), "asr": block([r for r in records if r["asr"]]), "tiers": {}}
+    for tier in TIERS:
+        rows = [r for r in records if r["tier"] == tier]
+        if rows:
+            summary["tiers"][tier] = dict(block(rows), hit_rate=len(rows) / len(records))
+    return summary
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+def _pct(value):
+    return "-" if value is None else f"{value * 100:5.1f}%"
+
+def _num(value):
+    return "-" if value is None else f"{value:9.2f}"
+
+def print_report(label, summary, records, verbose=False):
+    print(f"\n=== {label} ===")
+    print(f"{'tier':<12}{'hits':>6}{'hit rate':>10}{'intent':>9}{'full':>9}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    rows = [(t, s) for t, s in summary["tiers"].items()] + [("overall", summary["overall"]), ("asr only", summary["asr"])]
+    for name, s in rows:
+        if not s["count"]:
+            continue
+        print(f"{name:<12}{s['count']:>6}{_pct(s.get('hit_rate', 1.0 if name == 'overall' else None)):>10}"
+              f"{_pct(s['intent_accuracy']):>9}{_pct(s['full_accuracy']):>9}"
+              f"{_num(s['p50_ms']):>11}{_num(s['p95_ms']):>11}{_num(s['p99_ms']):>11}")
+
+    misses = [r for r in records if not r["params_ok"]]
+    if verbose and misses:
+        print("\nMisses:")
+        for r in misses:
+            print(f"  [{r['tier']}] {r['text']!r}: expected {r['expected']}, got {r['result']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline NLU accuracy / latency benchmark.")
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="Labelled utterances (JSON list)")
+    parser.add_argument("--llm-latency", type=float, default=0.6, help="Stub Gemini latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="+/- uniform jitter in seconds")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of stub calls that raise")
+    parser.add_argument("--no-llm", action="store_true", help="Run without an API key (local tiers only)")
+    parser.add_argument("--passes", type=int, default=2, help="Repeat the corpus (later passes hit the cache)")
+    parser.add_argument("--speculative", action="store_true", help="Use parse_command(speculative=True)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="List misclassified utterances")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    answers = {case["text"].strip().lower(): {"intent": case["intent"], "params": case["params"]} for case in corpus}
+    model = StubModel(answers, args.llm_latency, args.llm_jitter, args.llm_error_rate, args.seed)
+    install_stub(model)
+
+    from utils import nlu, intent_classifier
+
+    start = time.perf_counter()
+    intent_classifier.get_classifier()
+    print(f"Classifier trained in {time.perf_counter() - start:.2f}s")
+    nlu.configure_genai(None if args.no_llm else "offline-benchmark")
+
+    print(f"Corpus: {len(corpus)} utterances ({sum(bool(c.get('asr')) for c in corpus)} ASR mishearings), "
+          f"stub latency {args.llm_latency:.2f}s +/- {args.llm_jitter:.2f}s"
+          f"{', LLM disabled' if args.no_llm else ''}")
+
+    report = {"config": vars(args), "passes": []}
+    for n in range(args.passes):
+        records = run_pass(nlu, corpus, speculative=args.speculative)
+        summary = summarize(records)
+        print_report(f"Pass {n + 1}" + (" (cold cache)" if n == 0 else ""), summary, records,
+                     verbose=args.verbose and n == 0)
+        report["passes"].append(summary)
+
+    report["stub_calls"] = model.calls
+    report["llm_stats"] = nlu.get_llm_stats()
+    print(f"\nStub Gemini calls: {model.calls}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Summary written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+End-to-end turn latency from recorded audio.
+
+Usage:
+    python replay_session.py utils/data/replay_session.json --audio-dir replay_audio --render-missing
+    python replay_session.py my_session.json --asr vosk --vosk-model models/vosk-small-en --json report.json
+
+Replays a scripted conversation through the real assistant pipeline: voice.listen() reads the
+WAV files in order (voice.start_replay), the configured ASR backend transcribes them, and
+utils/dialogue.py parses and acts on each turn exactly as the app does. Speech output, IMAP/SMTP
+and Gemini are local stand-ins with configurable delays, so runs are repeatable and offline.
+
+For every turn the report records the stage timings
+    capture   loading the recorded phrase (the live app has it as soon as the user stops talking)
+    asr       speech-to-text
+    parse     nlu.parse_command
+    action    from the parsed intent to the first reply being handed to speech
+    tts       from that hand-off to the "started" event of the speech worker
+    total     sum of the above: end of the user's phrase to the assistant starting to talk
+plus the folder refresh the app runs after a turn ("refresh", not part of total).
+
+The script is a JSON object:
+    {"user": {"name", "gmail_email", "gmail_password"},
+     "mailbox": {"Inbox": [{"sender", "subject", "body"}], "Sent": [], ...},
+     "turns": [{"wav": "01.wav", "transcript": "open inbox", "intent": "navigation", "params": {...}}]}
+"wav" is relative to --audio-dir. "transcript" is what --asr scripted returns and what
+--render-missing synthesizes; "intent"/"params" are the expected parse (the stub Gemini answers with them).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+from nlu_benchmark import StubModel, install_stub, percentile, _ms, _num
+
+SPEAK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils", "speak.py")
+STAGES = ("capture", "asr", "parse", "action", "tts", "total", "refresh")
+
+class ReplayModel(StubModel):
+    """
+    StubModel that also answers summary / reply / batch enrichment prompts with canned text.
+    """
+
+    SUMMARY = "This is a stub summary of the email. No action is needed."
+    REPLIES = ["Thanks, sounds good.", "I will check and get back to you.", "Sorry, I can't make it."]
+
+    def generate_content(self, prompt, request_options=None, stream=False):
+        if 'User: "' in prompt:
+            return super().generate_content(prompt, request_options, stream)
+        # Same delay / error behaviour as parse calls
+        response = super().generate_content("", request_options)
+        if "### EMAIL" in prompt:
+            ids = [line.split()[-1] for line in prompt.splitlines() if line.strip().startswith("### EMAIL ")]
+            text = json.dumps({i: {"summary": self.SUMMARY, "replies": self.REPLIES} for i in ids})
+        elif "suggested replies" in prompt:
+            text = json.dumps(self.REPLIES)
+        else:
+            text = self.SUMMARY
+        if stream:
+            return [types.SimpleNamespace(text=word + " ") for word in text.split()]
+        response.text = text
+        return response
+
+class StubMailbox:
+    """
+    In-memory stand-in for utils/email_manager.py (same functions), with a delay per server round trip.
+    """
+
+    def __init__(self, folders, latency):
+        self.latency = latency
+        self.folders = {}
+        self.calls = 0
+        next_id = 1
+        for folder, messages in folders.items():
+            self.folders[folder] = []
+            for m in messages:
+                self.folders[folder].append({"id": str(next_id), "sender": m.get("sender", "Unknown"),
+                                             "subject": m.get("subject", "(No Subject)"), "body": m.get("body", "")})
+                next_id += 1
+        self._next_id = next_id
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def _find(self, folder, email_id):
+        return next((m for m in self.folders.get(folder, []) if m["id"] == email_id), None)
+
+    def fetch_emails(self, email_account, password, folder="Inbox", limit=10):
+        self._round_trip()
+        with self._lock:
+            messages = list(reversed(self.folders.get(folder, [])))[:limit]
+            return [{"id": m["id"], "subject": m["subject"], "sender": m["sender"], "date": "",
+                     "body": "", "snippet": ""} for m in messages]
+
+    def fetch_email_body(self, email_account, password, folder, email_id):
+        self._round_trip()
+        with self._lock:
+            m = self._find(folder, email_id)
+            return m["body"] if m else "Error: Email not found."
+
+    def fetch_email_bodies(self, email_account, password, folder, email_ids):
+        self._round_trip()
+        with self._lock:
+            found = (self._find(folder, i) for i in email_ids)
+            return {m["id"]: m["body"] for m in found if m}
+
+    def move_to_trash(self, email_account, password, current_folder, email_id):
+        self._round_trip()
+        with self._lock:
+            m = self._find(current_folder, email_id)
+            if not m:
+                return False
+            self.folders[current_folder].remove(m)
+            self.folders.setdefault("Trash", []).append(m)
+            return True
+
+    def send_email(self, email_account, password, to_email, subject, body):
+        self._round_trip()
+        with self._lock:
+            self.folders.setdefault("Sent", []).append({"id": str(self._next_id), "sender": email_account,
+                                                         "subject": subject, "body": body})
+            self._next_id += 1
+        return True
+
+class StubSpeechWorker:
+    """
+    Silent stand-in for voice.TTSWorker: emits the same started / finished events after a
+    simulated engine delay, "speaking" at chars_per_second (0 = finish immediately).
+    """
+
+    def __init__(self, start_delay=0.05, chars_per_second=0.0):
+        self.start_delay = start_delay
+        self.chars_per_second = chars_per_second
+        self.rate = None
+        self.voice = None
+        self.last_finished = 0.0
+        self._listeners = []
+        self._queue = []           # [(id, text)] not yet started
+        self._current = None       # (id, finish timer)
+        self._next_id = 0
+        self._cond = threading.Condition()
+
+    def start(self):
+        pass
+
+    def subscribe(self, callback):
+        with self._cond:
+            self._listeners.append(callback)
+
+        def unsubscribe():
+            with self._cond:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        return unsubscribe
+
+    def _emit(self, event):
+        if event["event"] == "finished":
+            self.last_finished = time.time()
+        for callback in list(self._listeners):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Speech Event Error: {e}")
+
+    def _start_next(self):
+        # Called with _cond held
+        if self._current or not self._queue:
+            return
+        utterance, text = self._queue.pop(0)
+        duration = len(text) / self.chars_per_second if self.chars_per_second else 0.0
+        timer = threading.Timer(self.start_delay, self._started, args=(utterance, duration))
+        self._current = (utterance, timer)
+        timer.start()
+
+    def _started(self, utterance, duration):
+        with self._cond:
+            if not self._current or self._current[0] != utterance:
+                return  # Stopped before it began
+            timer = threading.Timer(duration, self._finished, args=(utterance, True))
+            self._current = (utterance, timer)
+        self._emit({"event": "started", "id": utterance})
+        timer.start()
+
+    def _finished(self, utterance, completed):
+        with self._cond:
+            if not self._current or self._current[0] != utterance:
+                return
+            self._current = None
+            self._start_next()
+            self._cond.notify_all()
+        self._emit({"event": "finished", "id": utterance, "completed": completed})
+
+    def speak(self, text, interrupt=True):
+        if interrupt:
+            self.stop()
+        with self._cond:
+            self._next_id += 1
+            self._queue.append((self._next_id, text))
+            self._start_next()
+            return self._next_id
+
+    def play(self, path, text=None):
+        return self.speak(text or "", interrupt=True)
+
+    def stop(self):
+        with self._cond:
+            current, self._current = self._current, None
+            self._queue.clear()
+            self._cond.notify_all()
+        if current:
+            current[1].cancel()
+            self._emit({"event": "finished", "id": current[0], "completed": False})
+
+    def set_rate(self, rate):
+        self.rate = rate
+
+    def set_voice(self, voice):
+        self.voice = voice
+
+    def is_speaking(self):
+        with self._cond:
+            return bool(self._current or self._queue)
+
+    def wait(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not (self._current or self._queue), timeout)
+
+    def close(self):
+        self.stop()
+
+class ScriptedASR:
+    """
+    ASR stand-in returning the scripted transcripts in order, after a fixed delay.
+    """
+
+    name = "scripted"
+
+    def __init__(self, transcripts, latency):
+        self.transcripts = list(transcripts)
+        self.latency = latency
+
+    def transcribe(self, audio, on_partial=None):
+        time.sleep(self.latency)
+        return self.transcripts.pop(0).lower() if self.transcripts else None
+
+def load_script(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def render_missing(turns, audio_dir):
+    """
+    Synthesizes the transcript of every turn without a recording (speak.py --render).
+    """
+    jobs = [t for t in turns if not os.path.exists(os.path.join(audio_dir, t["wav"]))]
+    if not jobs:
+        return 0
+    os.makedirs(audio_dir, exist_ok=True)
+    process = subprocess.Popen([sys.executable, SPEAK_SCRIPT, "--render"],
+                               stdin=subprocess.PIPE, text=True, encoding="utf-8")
+    for t in jobs:
+        process.stdin.write(json.dumps({"text": t["transcript"], "path": os.path.join(audio_dir, t["wav"])}) + "\n")
+    process.stdin.close()
+    process.wait()
+    return len(jobs)
+
+def run_session(script, audio_dir, mailbox, nlu, voice, dialogue, verbose=False):
+    """
+    Replays every turn. Returns one record per turn.
+    """
+    turns = script["turns"]
+    state = dialogue.DialogueState(script.get("user") or {"name": "Replay", "gmail_email": "replay@example.com",
+                                                         "gmail_password": "replay"})
+    marks = {}
+    replies = []
+    speech_started = threading.Event()
+
+    def on_speech(event):
+        if event.get("event") == "started" and "first_started" not in marks and "first_say" in marks:
+            marks["first_started"] = time.perf_counter()
+            speech_started.set()
+
+    def note_say():
+        if "first_say" not in marks:
+            marks["first_say"] = time.perf_counter()
+
+    def say(text, wait=False):
+        note_say()
+        replies.append(text)
+        voice.speak(text)
+        if wait:
+            voice.wait_until_done(timeout=5 + 0.1 * len(text))
+
+    def stream_summary(body):
+        stream = voice.open_speech_stream()
+        shown = []
+        for sentence in nlu.stream_email_summary(body):
+            note_say()
+            shown.append(sentence)
+            if stream:
+                stream.say(sentence)
+        replies.append(" ".join(shown))
+        if not stream:
+            voice.speak(" ".join(shown))
+
+    voice.subscribe(on_speech)
+    dlg = dialogue.Dialogue(state, say, stream_summary=stream_summary, mail=mailbox)
+    source = voice.start_replay([os.path.join(audio_dir, t["wav"]) for t in turns])
+    dlg.refresh_folder()
+
+    records = []
+    for n, turn in enumerate(turns):
+        voice.wait_until_done(timeout=30)
+        if dlg.prompt():
+            voice.wait_until_done(timeout=30)
+        marks.clear()
+        replies.clear()
+        speech_started.clear()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cmd = voice.listen(on_partial=dlg.prefetch_from_partial)
+            heard = source.last or {}
+            before = nlu.get_tier_stats()
+            start = time.perf_counter()
+            intent_data = dlg.parse(cmd) if cmd else None
+            parsed = time.perf_counter()
+            if cmd:
+                dlg.handle(cmd, intent_data)
+            handled = time.perf_counter()
+            # The app's reader pane speaks an opened email on the next render
+            if state.auto_read and state.selected_email is not None:
+                state.auto_read = False
+                dlg.get_email_body(state.selected_email)
+                say(dlg.reading_text(state.selected_email))
+            if "first_say" in marks:
+                speech_started.wait(timeout=10)
+            refresh_start = time.perf_counter()
+            dlg.refresh_folder()
+            refreshed = time.perf_counter()
+        after = nlu.get_tier_stats()
+
+        first_say = marks.get("first_say")
+        first_started = marks.get("first_started")
+        stages = {
+            "capture": heard.get("capture"),
+            "asr": heard.get("asr"),
+            "parse": parsed - start if cmd else None,
+            "action": first_say - parsed if first_say else None,
+            "tts": first_started - first_say if first_say and first_started else None,
+            "refresh": refreshed - refresh_start,
+        }
+        parts = [stages[s] for s in ("capture", "asr", "parse", "action", "tts")]
+        stages["total"] = sum(parts) if None not in parts else None
+        expected = turn.get("intent")
+        intent = (intent_data or {}).get("intent")
+        records.append({
+            "turn": n + 1, "wav": turn["wav"], "transcript": cmd, "expected_transcript": turn.get("transcript"),
+            "audio_seconds": heard.get("audio_seconds"), "intent": intent, "params": (intent_data or {}).get("params"),
+            "expected_intent": expected, "intent_ok": None if expected is None else intent == expected,
+            "tier": next((t for t in after if after[t] != before[t]), None),
+            "replies": list(replies), "folder": state.current_folder,
+            "compose_stage": state.compose_stage if state.compose_mode else None,
+            "stages": stages,
+        })
+        if verbose:
+            print(output.getvalue(), end="")
+    voice.stop_replay()
+    return records
+
+def summarize(records):
+    summary = {}
+    for stage in STAGES:
+        values = [r["stages"][stage] for r in records if r["stages"][stage] is not None]
+        summary[stage] = {"count": len(values), "p50_ms": _ms(percentile(values, 0.50)),
+                          "p95_ms": _ms(percentile(values, 0.95)), "max_ms": _ms(max(values) if values else None)}
+    checked = [r for r in records if r["intent_ok"] is not None]
+    summary["intent_accuracy"] = sum(r["intent_ok"] for r in checked) / len(checked) if checked else None
+    return summary
+
+def print_report(records, summary):
+    print(f"\n{'turn':<5}{'heard':<28}{'intent':<22}{'tier':<11}" + "".join(f"{s + ' ms':>11}" for s in STAGES))
+    for r in records:
+        mark = "" if r["intent_ok"] in (None, True) else " !"
+        print(f"{r['turn']:<5}{(r['transcript'] or '-')[:27]:<28}{((r['intent'] or '-') + mark)[:21]:<22}"
+              f"{(r['tier'] or '-'):<11}" + "".join(f"{_num(_ms(r['stages'][s])):>11}" for s in STAGES))
+    print(f"\n{'stage':<10}{'turns':>6}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}")
+    for stage in STAGES:
+        s = summary[stage]
+        print(f"{stage:<10}{s['count']:>6}{_num(s['p50_ms']):>11}{_num(s['p95_ms']):>11}{_num(s['max_ms']):>11}")
+    if summary["intent_accuracy"] is not None:
+        print(f"\nIntent accuracy: {summary['intent_accuracy'] * 100:.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded conversation and time each turn.")
+    parser.add_argument("script", help="Conversation script (JSON)")
+    parser.add_argument("--audio-dir", help="Directory of the turn WAVs (default: next to the script)")
+    parser.add_argument("--render-missing", action="store_true", help="Synthesize missing WAVs from the transcripts")
+    parser.add_argument("--asr", default="scripted", help="scripted, google, vosk or whisper")
+    parser.add_argument("--asr-latency", type=float, default=0.0, help="Delay of --asr scripted in seconds")
+    parser.add_argument("--vosk-model", default=os.getenv("VOSK_MODEL_PATH"))
+    parser.add_argument("--whisper-model", default=os.getenv("WHISPER_MODEL", "base.en"))
+    parser.add_argument("--llm-latency", type=float, default=0.6, help="Stub Gemini latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="+/- uniform jitter in seconds")
+    parser.add_argument("--no-llm", action="store_true", help="Run without an API key (local tiers only)")
+    parser.add_argument("--mail-latency", type=float, default=0.3, help="Stub IMAP/SMTP round trip in seconds")
+    parser.add_argument("--tts-latency", type=float, default=0.05, help="Stub speech start delay in seconds")
+    parser.add_argument("--tts-cps", type=float, default=0.0, help="Stub speaking speed in chars/s (0: instant)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the per-turn report to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the assistant's log output")
+    args = parser.parse_args()
+
+    script = load_script(args.script)
+    turns = script["turns"]
+    audio_dir = args.audio_dir or os.path.dirname(os.path.abspath(args.script))
+    if args.render_missing:
+        print(f"Rendered {render_missing(turns, audio_dir)} missing recordings")
+    missing = [t["wav"] for t in turns if not os.path.exists(os.path.join(audio_dir, t["wav"]))]
+    if missing:
+        sys.exit(f"Missing recordings in {audio_dir}: {', '.join(missing)} (use --render-missing)")
+
+    answers = {t["transcript"].strip().lower(): {"intent": t["intent"], "params": t.get("params", {})}
+               for t in turns if t.get("transcript") and t.get("intent")}
+    model = ReplayModel(answers, args.llm_latency, args.llm_jitter, 0.0, args.seed)
+    install_stub(model)
+
+    from utils import nlu, voice, dialogue, intent_classifier, prompt_audio
+
+    prompt_audio.RENDER_AFTER_USES = float("inf")  # Nothing is synthesized during a replay
+    intent_classifier.get_classifier()
+    nlu.configure_genai(None if args.no_llm else "offline-replay")
+    voice.set_worker_factory(lambda: StubSpeechWorker(args.tts_latency, args.tts_cps))
+    if args.asr == "scripted":
+        voice.use_asr_backend(ScriptedASR([t.get("transcript") or "" for t in turns], args.asr_latency))
+    else:
+        voice.configure_asr(args.asr, vosk_model_path=args.vosk_model, whisper_model=args.whisper_model)
+    mailbox = StubMailbox(script.get("mailbox") or {"Inbox": []}, args.mail_latency)
+
+    print(f"Replaying {len(turns)} turns from {audio_dir} (ASR: {args.asr}, stub Gemini "
+          f"{'disabled' if args.no_llm else f'{args.llm_latency:.2f}s'}, mail {args.mail_latency:.2f}s, "
+          f"speech start {args.tts_latency:.2f}s)")
+    records = run_session(script, audio_dir, mailbox, nlu, voice, dialogue, verbose=args.verbose)
+    summary = summarize(records)
+    print_report(records, summary)
+    print(f"\nStub Gemini calls: {model.calls}, mail round trips: {mailbox.calls}")
+
+    if args.json:
+        report = {"config": vars(args), "summary": summary, "turns": records,
+                  "stub_calls": model.calls, "mail_calls": mailbox.calls}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Headless Swar: the voice assistant without Streamlit, for kiosks with no screen.
+
+Usage:
+    python swar_daemon.py
+    python swar_daemon.py --name desk-2 --mic 3 --camera 1 --metrics-port 9465
+
+Runs the same login (face scan, then spoken PIN) and the same voice dialogue as app.py as a
+long-lived process:
+
+    scanning  -> a known face is seen: "Welcome <name>. PIN?"        -> pin_check
+    pin_check -> the PIN is heard: "Logged in."                        -> active
+                 "stop"/"cancel", or PIN_TIMEOUT of silence            -> scanning
+    active    -> utils/voice_worker.py runs the dialogue until "logout" -> scanning
+
+Configuration comes from the same environment / .env as the app (GOOGLE_API_KEY, ASR_BACKEND,
+NLU_CACHE_DB, ...). Each process owns one microphone and one camera, so for several assistants
+on one host start one daemon per device pair (and give each its own --metrics-port).
+"""
+import argparse
+import os
+import signal
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+from utils import voice, auth, db, nlu, enrichment, dialogue, voice_worker, tracing
+
+SCAN_SECONDS = 2.0   # camera time per identification attempt
+PIN_TIMEOUT = 30.0   # seconds of silence before a pending PIN check goes back to scanning
+
+def init_resources(args):
+    """
+    Same setup as app.py's init_resources, with the devices taken from the command line.
+    """
+    tracing.configure(args.trace_file)
+    if args.metrics_port:
+        tracing.serve_metrics(args.metrics_port)
+    db.init_db()
+    nlu.warm_up_local_models()
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment")
+
+    nlu.configure_genai(api_key, cache_db_path=os.getenv("NLU_CACHE_DB"))
+    enrichment.configure(db_path=os.getenv("NLU_CACHE_DB", "nlu_cache.db"))
+    voice.configure_asr(os.getenv("ASR_BACKEND", "google"),
+                        vosk_model_path=os.getenv("VOSK_MODEL_PATH"),
+                        whisper_model=os.getenv("WHISPER_MODEL"))
+    voice.start_background_listening(device_index=args.mic)
+    voice.start_tts_worker()
+    voice.prerender_prompts(dialogue.CANNED_PROMPTS, cache_dir=os.getenv("PROMPT_AUDIO_DIR", "prompt_audio"))
+
+def say(text):
+    voice.speak(text)
+    # Block until the speech worker reports the utterance finished (timeout is only a safety net)
+    voice.wait_until_done(timeout=5.0 + len(text) * 0.1)
+    # The answer comes after the prompt: drop its echo and whatever the mic queued while scanning
+    voice.discard_heard()
+
+def login(args, stopping):
+    """
+    Face scan, then spoken PIN (as app.py's login_flow). Returns the user dict, or None when stopping.
+    """
+    stage = "scanning"
+    user = None
+    announced_unknown = False
+    while not stopping.is_set():
+        if stage == "scanning":
+            email = auth.scan_for_user(args.scan_seconds, camera_index=args.camera)
+            user = auth.load_user(email) if email else None
+            if user:
+                announced_unknown = False
+                say(f"Welcome {user['name']}. PIN?")
+                stage, pin_since = "pin_check", time.time()
+            elif not announced_unknown:
+                # Say it once; an empty kiosk would otherwise hear it every scan
+                say("Unknown face. Register?")
+                announced_unknown = True
+
+        elif stage == "pin_check":
+            pin_in = voice.listen(timeout=5)
+            if not pin_in:
+                if time.time() - pin_since > PIN_TIMEOUT:
+                    stage = "scanning"
+                continue
+            # Allow cancellation
+            if "stop" in pin_in.lower() or "cancel" in pin_in.lower():
+                say("Cancelled login.")
+                stage = "scanning"
+                continue
+            digits = ''.join(filter(str.isdigit, pin_in))
+            if digits == user['pin']:
+                say("Logged in.")
+                return user
+            say("Wrong PIN.")
+            pin_since = time.time()
+    return None
+
+def run(args, stopping):
+    while not stopping.is_set():
+        user = login(args, stopping)
+        if user is None:
+            break
+        worker = voice_worker.VoiceWorker(args.name, user, heartbeat_timeout=None)
+        worker.start()
+        while worker.running():
+            if stopping.is_set():
+                worker.stop()
+            time.sleep(0.5)
+        print(f"{user['name']} logged out.")
+
+def main():
+    load_dotenv()
+    mic = os.getenv("MIC_DEVICE_INDEX")
+    parser = argparse.ArgumentParser(description="Run Swar headless (no Streamlit).")
+    parser.add_argument("--name", default=uuid.uuid4().hex, help="session name (logs, speech process)")
+    parser.add_argument("--mic", type=int, default=int(mic) if mic else None,
+                        help="microphone device index (default: MIC_DEVICE_INDEX or system default)")
+    parser.add_argument("--camera", type=int, default=int(os.getenv("CAMERA_INDEX", "0")),
+                        help="webcam index for face login (default: CAMERA_INDEX or 0)")
+    parser.add_argument("--scan-seconds", type=float, default=SCAN_SECONDS)
+    parser.add_argument("--trace-file", default=os.getenv("TRACE_FILE"))
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "0")) or None)
+    args = parser.parse_args()
+
+    # Login prompts and the dialogue share this assistant's speech process
+    voice.use_session(args.name)
+    init_resources(args)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    print(f"Swar daemon '{args.name}' ready (mic={args.mic}, camera={args.camera}).")
+    try:
+        run(args, stopping)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopping.set()
+        voice.stop_background_listening()
+        voice.end_session(args.name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import threading
+import numpy as np
+import speech_recognition as sr
+
+# Speech-to-text backends behind one interface:
+#     backend.transcribe(audio, on_partial=None) -> lower-cased text or None
+# where audio is a speech_recognition.AudioData phrase and on_partial(text) receives the
+# transcript so far while decoding is still running. Offline engines are optional installs
+# and are only imported when selected (ASR_BACKEND=vosk / whisper).
+
+SAMPLE_RATE = 16000
+BACKENDS = ("google", "vosk", "whisper")
+
+class GoogleBackend:
+    """
+    Google Web Speech through speech_recognition. Needs internet; no partial results.
+    """
+
+    name = "google"
+
+    def __init__(self):
+        self._recognizer = sr.Recognizer()
+
+    def transcribe(self, audio, on_partial=None):
+        try:
+            return self._recognizer.recognize_google(audio).lower()
+        except sr.UnknownValueError:
+            return None
+
+class VoskBackend:
+    """
+    Offline Kaldi models (pip install vosk; model_path points at an unpacked model directory).
+    The phrase is fed in short chunks, so partial transcripts arrive before the final one.
+    """
+
+    name = "vosk"
+    CHUNK_SECONDS = 0.25
+
+    def __init__(self, model_path):
+        if not model_path:
+            raise ValueError("VOSK_MODEL_PATH is not set")
+        from vosk import Model, KaldiRecognizer, SetLogLevel
+        SetLogLevel(-1)
+        self._model = Model(model_path)
+        self._recognizer_class = KaldiRecognizer
+
+    def transcribe(self, audio, on_partial=None):
+        raw = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        recognizer = self._recognizer_class(self._model, SAMPLE_RATE)
+        step = int(SAMPLE_RATE * self.CHUNK_SECONDS) * 2
+        done, last = [], ""
+        for i in range(0, len(raw), step):
+            if recognizer.AcceptWaveform(raw[i:i + step]):
+                # Vosk closed a segment on an internal pause; keep it and continue
+                done.append(json.loads(recognizer.Result()).get("text", ""))
+                partial = ""
+            else:
+                partial = json.loads(recognizer.PartialResult()).get("partial", "")
+            text = " ".join(t for t in done + [partial] if t)
+            if on_partial and text and text != last:
+                on_partial(text)
+                last = text
+        done.append(json.loads(recognizer.FinalResult()).get("text", ""))
+        text = " ".join(t for t in done if t).strip()
+        return text.lower() or None
+
+class WhisperBackend:
+    """
+    Offline Whisper on CPU via faster-whisper (pip install faster-whisper), int8 quantized.
+    Segments are reported as partials as they are decoded.
+    """
+
+    name = "whisper"
+
+    def __init__(self, model_size="base.en"):
+        from faster_whisper import WhisperModel
+        self._model = WhisperModel(model_size or "base.en", device="cpu", compute_type="int8")
+        self._lock = threading.Lock()  # One decode at a time; they would only fight over the CPU
+
+    def transcribe(self, audio, on_partial=None):
+        raw = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+        parts = []
+        with self._lock:
+            segments, _ = self._model.transcribe(samples, beam_size=1, language="en")
+            for segment in segments:
+                parts.append(segment.text.strip())
+                if on_partial:
+                    on_partial(" ".join(parts))
+        text = " ".join(p for p in parts if p).strip()
+        return text.lower() or None
+
+def create_backend(name="google", vosk_model_path=None, whisper_model=None):
+    """
+    Builds the named backend. Raises ValueError / ImportError if it can't be used here.
+    """
+    name = (name or "google").lower()
+    if name == "google":
+        return GoogleBackend()
+    if name == "vosk":
+        return VoskBackend(vosk_model_path)
+    if name == "whisper":
+        return WhisperBackend(whisper_model)
+    raise ValueError(f"Unknown ASR backend '{name}' (choose from {', '.join(BACKENDS)})")
@@ -1,8 +1,8 @@
 import cv2
 import os
 import time
-from utils import face_auth
-from utils.db import get_all_users_encodings
+from utils import face_auth, tracing
+from utils.db import get_all_users_encodings, get_user_by_email
 
 # No longer need separate FACES_DIR logic as we store BLOBs in DB, 
 # but we might use it for debug or temp storage if needed. For now, strict DB usage.
@@ -30,6 +30,7 @@ def capture_face():
     
     return False, None
 
+@tracing.traced("auth.identify_face_camera")
 def identify_user_from_camera():
     """
     Captures a frame and attempts to identify against ALL users in DB.
@@ -46,6 +47,7 @@ def identify_user_from_camera():
     email, score = face_auth.identify_user(frame_bytes, users)
     return email, score
 
+@tracing.traced("auth.identify_face")
 def identify_user_from_frame_bytes(frame_bytes):
     """
     Identifies a user from already captured frame bytes.
@@ -56,6 +58,41 @@ def identify_user_from_frame_bytes(frame_bytes):
         return None, 0
     return face_auth.identify_user(frame_bytes, users)
 
+def scan_for_user(duration=2.0, camera_index=0, on_frame=None):
+    """
+    Reads the webcam for up to duration seconds, identifying on the fly (stops at the first match).
+    on_frame(frame) is called with every frame, e.g. to show a preview.
+    Returns: email (if found) or None
+    """
+    cap = cv2.VideoCapture(camera_index)
+    start = time.time()
+    try:
+        while (time.time() - start) < duration:
+            ret, frame = cap.read()
+            if ret:
+                if on_frame:
+                    on_frame(frame)
+                # Check every few frames to avoid lag
+                if int(time.time() * 10) % 2 == 0:
+                    _, buffer = cv2.imencode('.jpg', frame)
+                    email, score = identify_user_from_frame_bytes(buffer.tobytes())
+                    if email:
+                        return email
+            time.sleep(0.05)
+    finally:
+        cap.release()
+    return None
+
+def load_user(email):
+    """
+    The logged-in user record (name, email, pin, Gmail credentials) as a dict, or None.
+    """
+    ur = get_user_by_email(email)
+    if not ur:
+        return None
+    return {"name": ur.name, "email": ur.email, "pin": ur.pin,
+            "gmail_email": ur.gmail_email, "gmail_password": ur.gmail_password}
+
 def get_face_encoding_from_frame(frame):
     """
     Given a cv2 frame, return the encoding bytes to save.
@@ -0,0 +1,97 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache with optional TTL and optional SQLite persistence.
+    Values must be JSON-serializable; each get() returns a fresh copy.
+    With db_path set, entries are written through to disk and read back on a memory miss,
+    so they survive restarts. 'namespace' lets several caches share one file.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, db_path=None, namespace="default"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (created_at, json_value)
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            self._conn.commit()
+
+    def _expired(self, created_at):
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _remember(self, key, created_at, raw):
+        self._entries[key] = (created_at, raw)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the cached value or None on a miss / expired entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute("SELECT created_at, value FROM response_cache WHERE namespace=? AND key=?",
+                                         (self.namespace, key)).fetchone()
+                if row:
+                    entry = row
+                    self._remember(key, *row)
+
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    self._delete(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return json.loads(entry[1])
+
+    def set(self, key, value):
+        raw = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, raw)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO response_cache (namespace, key, value, created_at) VALUES (?, ?, ?, ?)",
+                                   (self.namespace, key, raw, now))
+                self._conn.commit()
+
+    def _delete(self, key):
+        self._entries.pop(key, None)
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM response_cache WHERE namespace=? AND key=?", (self.namespace, key))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM response_cache WHERE namespace=?", (self.namespace,))
+                self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                "hit_rate": (self.hits / total) if total else 0.0}
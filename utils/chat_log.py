@@ -0,0 +1,69 @@
+import threading
+from collections import deque
+
+# Append-only chat history shared by the voice worker (writer) and the page (reader).
+# Every add or edit stamps the message with a new revision, so a view that remembers the
+# revision it last showed can ask for just the messages that changed since then.
+
+MAX_MESSAGES = 20
+
+class ChatLog:
+    """
+    Bounded chat history. Messages are {"id", "sender", "message", "rev"}; the oldest drop off.
+    Thread-safe.
+    """
+
+    def __init__(self, maxlen=MAX_MESSAGES):
+        self._messages = deque(maxlen=maxlen)
+        self._next_id = 0
+        self._rev = 0
+        self._lock = threading.Lock()
+
+    @property
+    def revision(self):
+        return self._rev
+
+    def add(self, sender, message):
+        with self._lock:
+            self._next_id += 1
+            self._rev += 1
+            self._messages.append({"id": self._next_id, "sender": sender, "message": message, "rev": self._rev})
+            return self._next_id
+
+    def update_last(self, message, sender="Swar"):
+        """
+        Replaces the text of the newest message if it is from sender. Returns True if it changed.
+        """
+        with self._lock:
+            if not self._messages or self._messages[-1]["sender"] != sender \
+                    or self._messages[-1]["message"] == message:
+                return False
+            self._rev += 1
+            last = self._messages[-1]
+            last["message"], last["rev"] = message, self._rev
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+            self._rev += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [dict(m) for m in self._messages]
+
+    def changes_since(self, rev):
+        """
+        Messages added or edited after revision rev, the id of the oldest message still kept
+        (older ones were dropped or cleared), and the current revision.
+        """
+        with self._lock:
+            changed = [dict(m) for m in self._messages if m["rev"] > rev]
+            first_id = self._messages[0]["id"] if self._messages else self._next_id + 1
+            return changed, first_id, self._rev
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __len__(self):
+        return len(self._messages)
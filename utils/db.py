@@ -1,13 +1,91 @@
 import sqlite3
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
 
 DB_PATH = "users.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Check if table exists to migrate or create
-    c.execute('''
+# Connection tuning. WAL lets readers (login lookups) run while a writer is active,
+# and NORMAL sync is safe under WAL while avoiding an fsync on every commit.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",  # 256 MB memory mapped reads
+    "PRAGMA cache_size=-16000",    # ~16 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+STATEMENT_CACHE_SIZE = 128  # Prepared statements kept per connection
+
+# One long-lived connection per thread (sqlite3 connections must not be shared across threads)
+_local = threading.local()
+
+def get_connection():
+    """
+    Returns this thread's connection, opening and tuning it on first use.
+    Re-opens if DB_PATH has been changed since.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+    if conn is not None:
+        conn.close()
+
+    conn = sqlite3.connect(DB_PATH, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    _local.conn = conn
+    _local.path = DB_PATH
+    return conn
+
+def close_connection():
+    """
+    Closes this thread's connection (if any).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def transaction():
+    """
+    Runs the enclosed writes as one transaction: commit on success, rollback on error.
+    """
+    conn = get_connection()
+    with conn:
+        yield conn
+
+def execute_write(sql, params=()):
+    """
+    Executes a single write statement in its own transaction. Returns affected row count.
+    """
+    with transaction() as conn:
+        return conn.execute(sql, params).rowcount
+
+def execute_many(sql, rows):
+    """
+    Batched write helper: executes sql for every row inside one transaction.
+    Returns the total affected row count.
+    """
+    with transaction() as conn:
+        return conn.executemany(sql, rows).rowcount
+
+# --- SCHEMA MIGRATIONS ---
+# The schema version lives in PRAGMA user_version. Each migration runs once, in order,
+# inside its own transaction. Append new steps to the end of MIGRATIONS; never edit old ones.
+
+def _column_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def _migrate_v1(conn):
+    """
+    Original users table (face stored inline). Adds the Gmail columns to very old databases.
+    """
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -18,47 +96,172 @@ def init_db():
             gmail_password TEXT
         )
     ''')
-    
-    # Simple migration hack for existing table
+    cols = _column_names(conn, "users")
+    for col in ("gmail_email", "gmail_password"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {col} TEXT")
+
+def _migrate_v2(conn):
+    """
+    Moves face signatures out of users into face_templates (several per user allowed),
+    so user lookups no longer read the image BLOB.
+    """
+    conn.execute('''
+        CREATE TABLE face_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            encoding BLOB NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("INSERT INTO face_templates (user_id, encoding) SELECT id, face_encoding FROM users WHERE face_encoding IS NOT NULL")
+
+    # SQLite cannot drop a column portably, so rebuild the table without it
+    conn.execute('''
+        CREATE TABLE users_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            pin TEXT NOT NULL,
+            gmail_email TEXT,
+            gmail_password TEXT
+        )
+    ''')
+    conn.execute("INSERT INTO users_new (id, name, email, pin, gmail_email, gmail_password) "
+                 "SELECT id, name, email, pin, gmail_email, gmail_password FROM users")
+    conn.execute("DROP TABLE users")
+    conn.execute("ALTER TABLE users_new RENAME TO users")
+
+    conn.execute("CREATE INDEX idx_face_templates_user_id ON face_templates(user_id)")
+    conn.execute("CREATE INDEX idx_users_gmail_email ON users(gmail_email)")
+
+def _migrate_v3(conn):
+    # Ambient-noise calibration of each microphone, so startup doesn't have to re-measure it
+    conn.execute('''
+        CREATE TABLE mic_calibration (
+            device TEXT PRIMARY KEY,
+            energy_threshold REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+]
+
+def get_schema_version():
+    return get_connection().execute("PRAGMA user_version").fetchone()[0]
+
+def init_db():
+    """
+    Creates the database or upgrades it to the latest schema version.
+    """
+    conn = get_connection()
+    version = get_schema_version()
+    pending = [(v, step) for v, step in MIGRATIONS if v > version]
+    if not pending:
+        return
+
+    # Table rebuilds must not trigger ON DELETE actions; foreign_keys can only be toggled outside a transaction
+    conn.execute("PRAGMA foreign_keys=OFF")
     try:
-        c.execute("ALTER TABLE users ADD COLUMN gmail_email TEXT")
-        c.execute("ALTER TABLE users ADD COLUMN gmail_password TEXT")
-    except sqlite3.OperationalError:
-        pass # Columns likely exist
-        
-    conn.commit()
-    conn.close()
+        for target, step in pending:
+            with conn:
+                conn.execute("BEGIN")
+                step(conn)
+                broken = conn.execute("PRAGMA foreign_key_check").fetchall()
+                if broken:
+                    raise sqlite3.IntegrityError(f"Migration {target} left dangling references: {broken[:5]}")
+                conn.execute(f"PRAGMA user_version={target}")
+            print(f"Database migrated to schema version {target}")
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+
+# --- USERS ---
+
+class User(NamedTuple):
+    """
+    Login record. Deliberately excludes face data; see get_all_users_encodings for that.
+    """
+    id: int
+    name: str
+    email: str
+    pin: str
+    gmail_email: Optional[str]
+    gmail_password: Optional[str]
+
+USER_COLUMNS = ", ".join(User._fields)
 
 def add_user(name, email, pin, face_encoding, gmail_email=None, gmail_password=None):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO users (name, email, pin, face_encoding, gmail_email, gmail_password) VALUES (?, ?, ?, ?, ?, ?)",
-              (name, email, pin, face_encoding, gmail_email, gmail_password))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        cur = conn.execute("INSERT INTO users (name, email, pin, gmail_email, gmail_password) VALUES (?, ?, ?, ?, ?)",
+                           (name, email, pin, gmail_email, gmail_password))
+        if face_encoding:
+            conn.execute("INSERT INTO face_templates (user_id, encoding) VALUES (?, ?)", (cur.lastrowid, face_encoding))
+
+def add_face_template(email, face_encoding):
+    """
+    Stores an additional face signature for an existing user. Returns False if the user is unknown.
+    """
+    return execute_write("INSERT INTO face_templates (user_id, encoding) SELECT id, ? FROM users WHERE email=?",
+                         (face_encoding, email)) > 0
 
 def update_user_credentials(email, gmail_email, gmail_password):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE users SET gmail_email=?, gmail_password=? WHERE email=?", (gmail_email, gmail_password, email))
-    conn.commit()
-    conn.close()
+    execute_write("UPDATE users SET gmail_email=?, gmail_password=? WHERE email=?", (gmail_email, gmail_password, email))
 
 def get_user_by_email(email):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE email=?", (email,))
-    user = c.fetchone()
-    conn.close()
-    return user
+    """
+    Returns a User (without face data) or None.
+    """
+    row = get_connection().execute(f"SELECT {USER_COLUMNS} FROM users WHERE email=?", (email,)).fetchone()
+    return User(*row) if row else None
 
 def get_all_users_encodings():
     """
-    Returns a list of (email, face_encoding) for all users.
+    Returns a list of (email, face_encoding) for all stored face templates.
+    Users with several templates appear once per template.
+    """
+    return get_connection().execute(
+        "SELECT u.email, f.encoding FROM face_templates f JOIN users u ON u.id = f.user_id"
+    ).fetchall()
+
+def get_all_emails():
+    """
+    Returns the set of registered emails (used to skip duplicates in bulk imports).
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT email, face_encoding FROM users WHERE face_encoding IS NOT NULL")
-    users = c.fetchall()
-    conn.close()
-    return users
+    return {row[0] for row in get_connection().execute("SELECT email FROM users")}
+
+def add_users_bulk(users):
+    """
+    Inserts many users in one transaction.
+    users: list of (name, email, pin, face_encoding) tuples.
+    Returns the number of rows inserted; emails that already exist are skipped.
+    """
+    with transaction() as conn:
+        inserted = conn.executemany("INSERT OR IGNORE INTO users (name, email, pin) VALUES (?, ?, ?)",
+                                    [(name, email, pin) for name, email, pin, _ in users]).rowcount
+        # Only attach a template to users that have none, so skipped duplicates keep their existing face
+        conn.executemany(
+            "INSERT INTO face_templates (user_id, encoding) SELECT id, ? FROM users "
+            "WHERE email=? AND NOT EXISTS (SELECT 1 FROM face_templates f WHERE f.user_id = users.id)",
+            [(enc, email) for _, email, _, enc in users if enc])
+    return inserted
+
+# --- MICROPHONE CALIBRATION ---
+
+def get_mic_calibration(device):
+    """
+    Returns the stored energy threshold for the input device, or None.
+    """
+    row = get_connection().execute(
+        "SELECT energy_threshold FROM mic_calibration WHERE device = ?", (device,)).fetchone()
+    return row[0] if row else None
+
+def save_mic_calibration(device, energy_threshold):
+    execute_write(
+        "INSERT INTO mic_calibration (device, energy_threshold, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(device) DO UPDATE SET energy_threshold = excluded.energy_threshold, "
+        "updated_at = excluded.updated_at",
+        (device, energy_threshold, time.time()))
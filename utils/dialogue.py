@@ -0,0 +1,422 @@
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import parseaddr
+from utils import voice, nlu, intents, enrichment, email_manager, tracing
+
+# Voice command handling, independent of the UI. State lives on any attribute object with the
+# fields of DialogueState (st.session_state in app.py); replies go out through the front end's
+# say() / stream_summary() callbacks. The mail module can be swapped for a local stand-in.
+
+PREFETCH_MAX_AGE = 30 # seconds a speculative folder prefetch stays usable
+
+# Short phrases rendered to WAV at startup (utils/prompt_audio.py); other phrases are
+# rendered automatically once they have been repeated a few times.
+CANNED_PROMPTS = [
+    "Opening Inbox", "Opening Sent", "Opening Trash", "Opening Drafts", "Opening Settings",
+    "I didn't understand.", "Who is the email for?", "Stopped.", "Stopped reading.",
+    "Logged in.", "Logged out.", "Cancelled.", "Invalid number.", "Which email?",
+    "Great. Subject?", "Subject set. Message?", "Message set. Say 'Yes' to send.",
+    "Please say Yes or No.", "Open an email first.", "Sending email...",
+    "Wrong PIN.", "Cancelled login.", "Unknown face. Register?",
+]
+
+class DialogueState:
+    """
+    Plain-object version of the session fields the dialogue reads and writes.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.logged_in = user is not None
+        self.auth_stage = 'init'
+        self.temp_user = None
+        self.emails = []
+        self.selected_email = None
+        self.current_folder = "Inbox"
+        self.compose_mode = False
+        self.compose_stage = 'init'
+        self.draft = {"to": "", "subject": "", "body": ""}
+        self.last_fetched_folder = None
+        self.auto_read = False
+        self.prefetched_folders = {}
+
+def run_in_background(fn):
+    """
+    Runs fn in a daemon thread (in the caller's trace) and returns a Future for its result.
+    """
+    future = Future()
+    fn = tracing.bind(fn)
+    def run():
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+class Dialogue:
+    """
+    One assistant conversation: turns utterances into intents and acts on them.
+    say(text, wait=False) speaks and logs a reply; stream_summary(body) speaks a summary as it is generated.
+    """
+
+    def __init__(self, state, say, stream_summary=None, mail=email_manager):
+        self.state = state
+        self.say = say
+        self.stream_summary = stream_summary or (lambda body: say(nlu.summarize_email_content(body)))
+        self.mail = mail
+
+    def credentials(self):
+        user = self.state.user or {}
+        return user.get('gmail_email'), user.get('gmail_password')
+
+    # --- mailbox ---
+
+    def refresh_folder(self):
+        """
+        Loads the current folder if it hasn't been fetched yet (using a speculative prefetch if one
+        is fresh), then downloads and enriches the bodies in the background. Returns True if it loaded.
+        """
+        s = self.state
+        cur_f = s.current_folder
+        if s.compose_mode or cur_f == "Settings" or s.last_fetched_folder == cur_f:
+            return False
+        g_u, g_p = self.credentials()
+        if not g_u or not g_p:
+            return False
+        # Use a speculative prefetch started while NLU was still confirming the command
+        pending = s.prefetched_folders.pop(cur_f, None)
+        emails = None
+        if pending is not None and time.time() - pending[0] < PREFETCH_MAX_AGE:
+            try:
+                emails = pending[1].result(timeout=15)
+            except Exception as e:
+                print(f"Prefetch Error: {e}")
+        if emails is None:
+            emails = self.mail.fetch_emails(g_u, g_p, folder=cur_f, limit=10)
+        s.emails = emails
+        s.last_fetched_folder = cur_f
+        self.prefetch_folder(s.emails, g_u, g_p, cur_f)
+        return True
+
+    def prefetch_folder(self, emails, g_u, g_p, folder):
+        """
+        Background: downloads the listed bodies over one IMAP session, then
+        summarizes them in batched Gemini requests so later commands answer instantly.
+        """
+        def run():
+            missing = [e['id'] for e in emails if not e.get('body')]
+            bodies = self.mail.fetch_email_bodies(g_u, g_p, folder, missing)
+            for e in emails:
+                if not e.get('body') and e['id'] in bodies:
+                    e['body'] = bodies[e['id']]
+            enrichment.enrich_batch_async([e.get('body') for e in emails])
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_email_body(self, idx):
+        """
+        Returns the body of email idx, fetching it from IMAP and caching it in the state on first use.
+        """
+        data = self.state.emails[idx]
+        if not data.get("body"):
+            g_u, g_p = self.credentials()
+            if g_u and g_p:
+                data['body'] = self.mail.fetch_email_body(g_u, g_p, self.state.current_folder, data['id'])
+        # Precompute summary + suggested replies in the background (no-op once cached)
+        enrichment.enrich_async(data.get("body"))
+        return data.get("body", "")
+
+    def reading_text(self, idx):
+        """
+        What the assistant says when reading email idx aloud.
+        """
+        data = self.state.emails[idx]
+        # Strip newlines and excessive whitespace for smoother reading
+        txt = (data.get('body') or "").replace("\n", " ").strip()
+        return f"From: {data['sender']}. Subject: {data['subject']}. Message: {txt}"
+
+    def start_speculative_prefetch(self, intent_data):
+        """
+        NLU callback for a tentative intent (Gemini still confirming it).
+        Starts only read-only work: fetching the target folder's headers or the email body
+        (fetch_email_body peeks, so a guess that turns out wrong leaves the message unread).
+        """
+        s = self.state
+        intent = intent_data.get("intent")
+        params = intent_data.get("params", {})
+        g_u, g_p = self.credentials()
+        if not g_u or not g_p:
+            return
+
+        if intent == "navigation":
+            folder = params.get("folder_name")
+            if folder and folder != "Settings" and folder != s.current_folder \
+                    and folder not in s.prefetched_folders:
+                s.prefetched_folders[folder] = (time.time(), run_in_background(
+                    lambda: self.mail.fetch_emails(g_u, g_p, folder=folder, limit=10)))
+        elif intent in ("open_email", "summarize_email"):
+            idx = params.get("index")
+            emails = s.emails
+            if idx is not None and 0 <= idx < len(emails) and not emails[idx].get("body"):
+                data, folder = emails[idx], s.current_folder
+                def fetch_body():
+                    data['body'] = self.mail.fetch_email_body(g_u, g_p, folder, data['id'])
+                run_in_background(fetch_body)
+
+    def prefetch_from_partial(self, text):
+        """
+        Partial transcript callback: if the words so far already name a folder or email
+        (grammar tier only, no API call), start fetching it before the sentence is finished.
+        """
+        intent_data = nlu.regex_fallback(text)
+        if intent_data.get("intent") in ("navigation", "open_email", "summarize_email"):
+            self.start_speculative_prefetch(intent_data)
+
+    def send_current_draft(self):
+        """
+        Sends the draft. Returns True if it was sent (the dialogue then moves to the Sent folder).
+        """
+        s = self.state
+        d = s.draft
+        g_u, g_p = self.credentials()
+
+        if not g_u or not g_p:
+            self.say("Error. Missing Gmail Settings.")
+            return False
+
+        if not d['to']:
+            self.say("Error. No recipient.")
+            return False
+
+        self.say("Sending email...")
+        if self.mail.send_email(g_u, g_p, d['to'], d['subject'], d['body']):
+            self.say("Sent successfully! Opening Sent folder.")
+            s.compose_mode = False
+            s.compose_stage = 'init'
+            s.current_folder = "Sent"
+            s.last_fetched_folder = None
+            # Reset draft
+            s.draft = {"to": "", "subject": "", "body": ""}
+            return True
+        self.say("Failed to send. Check credentials.")
+        return False
+
+    # --- turns ---
+
+    def prompt(self):
+        """
+        Speaks the compose wizard's opening question if due. Returns True if it did.
+        """
+        s = self.state
+        if s.compose_mode and s.compose_stage == 'init':
+            s.compose_stage = 'recipient'
+            self.say("Who is the email for?")
+            return True
+        return False
+
+    def parse(self, cmd):
+        return nlu.parse_command(cmd, speculative=True, on_early_intent=self.start_speculative_prefetch) \
+            or {"intent": "unknown", "params": {}}
+
+    def handle(self, cmd, intent_data=None):
+        """
+        Acts on one user utterance (parsing it first unless intent_data is given). Returns the intent dict.
+        """
+        if intent_data is None:
+            intent_data = self.parse(cmd)
+        intent = intent_data.get("intent")
+        params = intent_data.get("params") or {}
+        if self.state.compose_mode:
+            self._handle_compose(cmd, intent, params)
+        else:
+            self._handle_command(cmd, intent, params)
+        return intent_data
+
+    def _open_folder(self, f):
+        s = self.state
+        s.current_folder = f
+        s.last_fetched_folder = None
+        s.selected_email = None
+        s.compose_mode = False
+        self.say(f"Opening {f}")
+
+    def _stop(self):
+        voice.stop_speaking()
+        self.say("Stopped.")
+
+    def _logout(self):
+        voice.stop_speaking()
+        self.state.logged_in = False
+        self.state.auth_stage = "init"
+        self.say("Logged out.")
+
+    def _handle_compose(self, cmd, intent, params):
+        s = self.state
+        # --- GLOBAL INTENT OVERRIDE ---
+        # Allow user to switch context (e.g. "Open Inbox") even while composing
+        if intent == "navigation":
+            f = params.get("folder_name")
+            if f:
+                self._open_folder(f)
+            return
+        if intent == "stop":
+            self._stop()
+            return
+        if intent == "logout":
+            self._logout()
+            return
+        if intent == "send_draft":
+            # "Send Now" button
+            self.send_current_draft()
+            return
+        if intent == "open_email":
+            # If user tries to open an email, exit compose and open it
+            idx = params.get("index")
+            if idx is not None:
+                s.compose_mode = False
+                s.selected_email = idx
+                s.auto_read = True
+                self.say(f"Opening email {idx+1}")
+            return
+        # ------------------------------
+
+        stage = s.compose_stage
+        text = cmd.lower()
+
+        if "cancel" in text or intent == "cancel":
+            s.compose_mode = False
+            s.compose_stage = 'init'
+            self.say("Cancelled.")
+
+        elif stage == 'recipient':
+            # NLU might already have sanitized it in 'value' if intent was compose_action
+            # If not, fall back to basic cleanup
+            if intent == "compose_action" and params.get("value"):
+                cln = params.get("value")
+            else:
+                cln = text.replace(" at ", "@").replace(" dot ", ".").replace(" ", "")
+            s.draft['to'] = cln
+            s.compose_stage = 'recipient_confirm'
+            self.say(f"I heard {cln}. Is this correct?")
+
+        elif stage == 'recipient_confirm':
+            # "No" first: "not correct" must not confirm a misheard address
+            if (intent == "confirmation" and params.get("value") == "no") or intents.is_negative(text):
+                s.draft['to'] = ""
+                s.compose_stage = 'recipient'
+                self.say("Okay. Who is the email for?")
+            elif (intent == "confirmation" and params.get("value") == "yes") or \
+               "yes" in text or "correct" in text:
+                s.compose_stage = 'subject'
+                self.say("Great. Subject?")
+            else:
+                self.say("Please say Yes or No.")
+
+        elif stage == 'subject':
+            s.draft['subject'] = cmd
+            s.compose_stage = 'message'
+            self.say("Subject set. Message?")
+
+        elif stage == 'message':
+            s.draft['body'] = cmd
+            s.compose_stage = 'confirm'
+            self.say("Message set. Say 'Yes' to send.")
+
+        elif stage == 'confirm':
+            if intents.is_negative(text):
+                self.say("Say 'Yes' to send, or 'Cancel'.")
+            elif (intent == "confirmation" and params.get("value") == "yes") or \
+               "yes" in text or "send" in text:
+                self.send_current_draft()
+            else:
+                self.say("Say 'Yes' to send, or 'Cancel'.")
+
+    def _handle_command(self, cmd, intent, params):
+        s = self.state
+        if intent == "navigation":
+            f = params.get("folder_name")
+            if f:
+                self._open_folder(f)
+
+        elif intent == "open_email":
+            idx = params.get("index")
+            if idx is not None:
+                if 0 <= idx < len(s.emails):
+                    s.selected_email = idx
+                    s.auto_read = True
+                    self.say(f"Opening email {idx+1}")
+                else:
+                    self.say("Invalid number.")
+
+        elif intent == "compose_start":
+            s.compose_mode = True
+            s.compose_stage = 'init'
+            self.say("Starting Composer.")
+
+        elif intent == "stop":
+            self._stop()
+
+        elif intent == "logout":
+            self._logout()
+
+        elif intent == "delete_email":
+            target_idx = params.get('index')
+            if target_idx is None:
+                target_idx = s.selected_email
+
+            if target_idx is not None and 0 <= target_idx < len(s.emails):
+                email_id = s.emails[target_idx]['id']
+                g_u, g_p = self.credentials()
+                if self.mail.move_to_trash(g_u, g_p, s.current_folder, email_id):
+                    s.current_folder = "Trash"
+                    s.last_fetched_folder = None
+                    s.selected_email = None # Clear selection to show list
+                    self.say(f"Deleted email {target_idx+1}. Opening Trash.")
+                else:
+                    self.say("Failed to delete.")
+            else:
+                self.say("Which email?")
+
+        elif intent == "summarize_email":
+            idx = params.get("index")
+            if idx is None:
+                idx = s.selected_email
+            if idx is not None and 0 <= idx < len(s.emails):
+                body = self.get_email_body(idx)
+                extras = enrichment.get(body)
+                if extras:
+                    self.say(extras["summary"])
+                else:
+                    self.stream_summary(body)
+            else:
+                self.say("Which email should I summarize?")
+
+        elif intent == "reply_with_suggestion":
+            sel = s.selected_email
+            if sel is not None and 0 <= sel < len(s.emails):
+                body = self.get_email_body(sel)
+                extras = enrichment.get(body)
+                replies = extras["replies"] if extras else nlu.generate_suggested_replies(body)
+                opt = params.get("index", 0)
+                if 0 <= opt < len(replies):
+                    data = s.emails[sel]
+                    subject = data['subject'] if data['subject'].lower().startswith("re:") else f"Re: {data['subject']}"
+                    s.draft = {"to": parseaddr(data['sender'])[1], "subject": subject, "body": replies[opt]}
+                    s.compose_mode = True
+                    s.compose_stage = 'confirm'
+                    self.say(f"Reply: {replies[opt]}. Say 'Yes' to send.")
+                else:
+                    self.say("I don't have that suggestion.")
+            else:
+                self.say("Open an email first.")
+
+        elif intent == "read_content":
+            # Explicitly read the currently open email
+            if s.selected_email is not None:
+                s.auto_read = True
+            else:
+                self.say("No email is open to read.")
+
+        else:
+            self.say("I didn't understand.")
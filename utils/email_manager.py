@@ -9,11 +9,13 @@ import smtplib
 import email
 from email.header import decode_header
 import os
+from utils import tracing
 
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
 IMAP_SERVER = "imap.gmail.com"
 
+@tracing.traced("email.connect")
 def connect_imap(email_account, password):
     try:
         mail = imaplib.IMAP4_SSL(IMAP_SERVER)
@@ -32,6 +34,7 @@ GMAIL_FOLDERS = {
     "Starred": "[Gmail]/Starred"
 }
 
+@tracing.traced("email.fetch_emails")
 def fetch_emails(email_account, password, folder="Inbox", limit=10):
     """
     Fetches the top 'limit' emails from the specified 'folder' (Human readable).
@@ -125,9 +128,57 @@ def fetch_emails(email_account, password, folder="Inbox", limit=10):
         print(f"Fetch Error: {e}")
         return []
 
+def _select_folder(mail, folder):
+    """
+    Selects a human readable folder, trying the usual Gmail names for Sent/Trash.
+    """
+    imap_folder = GMAIL_FOLDERS.get(folder, folder)
+    if folder == "Sent":
+         candidates = ["\"[Gmail]/Sent Mail\"", "\"[Gmail]/Sent\"", "Sent", "\"Sent Items\""]
+    elif folder == "Trash":
+         candidates = ["\"[Gmail]/Trash\"", "\"[Gmail]/Bin\"", "Trash", "Bin"]
+    else:
+         candidates = [imap_folder]
+    status = None
+    for c in candidates:
+        status, _ = mail.select(c)
+        if status == "OK": break
+    return status
+
+def _logout(mail):
+    try:
+        mail.logout()
+    except Exception:
+        pass  # Connection already gone
+
+def _extract_body(msg_data):
+    """
+    Returns the text/plain body from a full-message fetch response.
+    """
+    body = "Error reading body."
+    for response_part in msg_data:
+        if isinstance(response_part, tuple):
+            msg = email.message_from_bytes(response_part[1])
+            # Extract body
+            if msg.is_multipart():
+                for part in msg.walk():
+                    content_type = part.get_content_type()
+                    try:
+                        body_part = part.get_payload(decode=True)
+                        if body_part and content_type == "text/plain":
+                            body = body_part.decode("utf-8", errors="ignore")
+                            break
+                    except: pass
+            else:
+                body_part = msg.get_payload(decode=True)
+                if body_part:
+                    body = body_part.decode("utf-8", errors="ignore")
+    return body
+
+@tracing.traced("email.fetch_email_body")
 def fetch_email_body(email_account, password, folder, email_id):
     """
-    Lazily fetches the body of a specific email.
+    Lazily fetches the body of a specific email without marking it read.
     """
     if not email_account or not password: return "Error: No creds"
     
@@ -135,51 +186,44 @@ def fetch_email_body(email_account, password, folder, email_id):
     if not mail: return "Error: Connect failed"
     
     try:
-        imap_folder = GMAIL_FOLDERS.get(folder, folder)
         # We must select the folder again
-        # Logic for Sent/Trash robustness
-        target_folder = imap_folder
-        if folder == "Sent":
-             candidates = ["\"[Gmail]/Sent Mail\"", "\"[Gmail]/Sent\"", "Sent", "\"Sent Items\""]
-             for c in candidates:
-                 status, _ = mail.select(c)
-                 if status == "OK": break
-        elif folder == "Trash":
-             candidates = ["\"[Gmail]/Trash\"", "\"[Gmail]/Bin\"", "Trash", "Bin"]
-             for c in candidates:
-                 status, _ = mail.select(c)
-                 if status == "OK": break
-        else:
-             mail.select(imap_folder)
+        _select_folder(mail, folder)
              
-        # Fetch body
-        res, msg_data = mail.fetch(email_id, "(RFC822)")
-        
-        body = "Error reading body."
-        for response_part in msg_data:
-            if isinstance(response_part, tuple):
-                msg = email.message_from_bytes(response_part[1])
-                # Extract body
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        content_type = part.get_content_type()
-                        try:
-                            body_part = part.get_payload(decode=True)
-                            if body_part and content_type == "text/plain":
-                                body = body_part.decode("utf-8", errors="ignore")
-                                break
-                        except: pass
-                else:
-                    body_part = msg.get_payload(decode=True)
-                    if body_part:
-                        body = body_part.decode("utf-8", errors="ignore")
-        
-        mail.logout()
-        return body
+        # Fetch body (PEEK leaves the \Seen flag alone; prefetching must not mark mail read)
+        res, msg_data = mail.fetch(email_id, "(BODY.PEEK[])")
+        return _extract_body(msg_data)
     except Exception as e:
         print(f"Body Fetch Error: {e}")
         return f"Error: {e}"
+    finally:
+        _logout(mail)
+
+@tracing.traced("email.fetch_email_bodies")
+def fetch_email_bodies(email_account, password, folder, email_ids):
+    """
+    Fetches several bodies over a single IMAP connection.
+    Returns {email_id: body}; ids that fail are left out.
+    """
+    if not email_account or not password or not email_ids: return {}
+
+    mail = connect_imap(email_account, password)
+    if not mail: return {}
+
+    bodies = {}
+    try:
+        if _select_folder(mail, folder) != "OK":
+            return {}
+        for email_id in email_ids:
+            res, msg_data = mail.fetch(email_id, "(BODY.PEEK[])")
+            if res == "OK":
+                bodies[email_id] = _extract_body(msg_data)
+    except Exception as e:
+        print(f"Bodies Fetch Error: {e}")
+    finally:
+        _logout(mail)
+    return bodies
 
+@tracing.traced("email.move_to_trash")
 def move_to_trash(email_account, password, current_folder, email_id):
     """
     Moves an email to the Trash folder (Copy + Delete).
@@ -241,6 +285,7 @@ def move_to_trash(email_account, password, current_folder, email_id):
         print(f"Fetch Error: {e}")
         return []
 
+@tracing.traced("email.send_email")
 def send_email(email_account, password, to_email, subject, body):
     if not email_account or not password:
         return False
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from utils import nlu
+from utils.cache import ResponseCache
+
+# Background precomputation of summaries and suggested replies.
+# Results are keyed by a hash of the email body plus the prompt versions, so the same
+# message is never processed twice and a prompt change simply misses the old entries.
+
+MAX_CONCURRENT = 2  # Gemini calls allowed in parallel for enrichment
+MEMORY_ENTRIES = 256
+
+_store = ResponseCache(max_entries=MEMORY_ENTRIES, namespace="enrichment")
+_max_concurrent = MAX_CONCURRENT
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT, thread_name_prefix="enrich")
+_in_flight = {}  # key -> Future
+_lock = threading.Lock()
+
+def configure(db_path=None, max_concurrent=MAX_CONCURRENT):
+    """
+    Persists results to db_path (SQLite) and sets the concurrency budget.
+    """
+    global _store, _executor, _max_concurrent
+    _store = ResponseCache(max_entries=MEMORY_ENTRIES, db_path=db_path, namespace="enrichment")
+    if max_concurrent != _max_concurrent:
+        _executor.shutdown(wait=False)
+        _executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="enrich")
+        _max_concurrent = max_concurrent
+
+def content_key(body):
+    digest = hashlib.sha256(body.encode("utf-8", errors="ignore")).hexdigest()
+    return f"s{nlu.SUMMARY_PROMPT_VERSION}-r{nlu.REPLIES_PROMPT_VERSION}:{digest}"
+
+def _enrichable(body):
+    return bool(body) and nlu.llm_available() and not body.startswith("Error")
+
+def get(body):
+    """
+    Returns {"summary": str, "replies": [str]} if already computed, else None.
+    """
+    if not body:
+        return None
+    return _store.get(content_key(body))
+
+def _run(key, body):
+    try:
+        result = nlu.enrich_email(body)
+        _store.set(key, result)
+        return result
+    except Exception as e:
+        print(f"Enrichment Error: {e}")
+        return None
+    finally:
+        with _lock:
+            _in_flight.pop(key, None)
+
+def enrich_async(body):
+    """
+    Schedules summary + replies for body in the background (no-op if cached or already running).
+    Returns the Future, or None if nothing was scheduled.
+    """
+    if not _enrichable(body):
+        return None
+    key = content_key(body)
+    with _lock:
+        if key in _in_flight:
+            return _in_flight[key]
+        if _store.get(key) is not None:
+            return None
+        future = _executor.submit(_run, key, body)
+        _in_flight[key] = future
+        return future
+
+def _run_batch(items):
+    # Short ids keep the prompt small; map them back to content keys afterwards
+    try:
+        results = nlu.enrich_emails_batch([(str(n), body) for n, (_, body) in enumerate(items)])
+        for n, (key, _) in enumerate(items):
+            if str(n) in results:
+                _store.set(key, results[str(n)])
+    except Exception as e:
+        print(f"Batch Enrichment Error: {e}")
+    finally:
+        with _lock:
+            for key, _ in items:
+                _in_flight.pop(key, None)
+
+def enrich_batch_async(bodies):
+    """
+    Schedules enrichment for many bodies at once, packing the uncached ones into
+    batched requests (nlu.BATCH_SIZE emails per Gemini call). Returns the scheduled Futures.
+    """
+    futures = []
+    with _lock:
+        todo = {}
+        for body in bodies:
+            if not _enrichable(body):
+                continue
+            key = content_key(body)
+            if key in _in_flight or key in todo or _store.get(key) is not None:
+                continue
+            todo[key] = body
+
+        items = list(todo.items())
+        for i in range(0, len(items), nlu.BATCH_SIZE):
+            chunk = items[i:i + nlu.BATCH_SIZE]
+            future = _executor.submit(_run_batch, chunk)
+            for key, _ in chunk:
+                _in_flight[key] = future
+            futures.append(future)
+    return futures
+
+def wait_for(body, timeout=None):
+    """
+    Returns the enrichment for body, waiting up to timeout seconds if it is still being computed.
+    """
+    cached = get(body)
+    if cached is not None or not body:
+        return cached
+    with _lock:
+        future = _in_flight.get(content_key(body))
+    if future is None:
+        return None
+    try:
+        future.result(timeout=timeout)
+    except TimeoutError:
+        return None
+    return get(body)
@@ -2,6 +2,18 @@ import cv2  # Import OpenCV for image processing
 import numpy as np  # Import NumPy for array operations
 import io  # Import IO for byte streams
 
+_face_cascade = None  # Haar cascade, loaded once per process
+
+def _get_face_cascade():
+    """
+    Returns the shared Haar cascade, loading it on first use.
+    Loading the XML costs far more than a detection, so bulk jobs reuse it.
+    """
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _face_cascade
+
 def get_face_encodings_from_image(image_bytes):
     """
     Detects a face in the image and returns the cropped face image as bytes.
@@ -13,7 +25,7 @@ def get_face_encodings_from_image(image_bytes):
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)  # Decode array to image
 
         # Load Haar Cascade
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')  # Load face detector
+        face_cascade = _get_face_cascade()  # Load face detector
 
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)  # Convert to grayscale
         faces = face_cascade.detectMultiScale(gray, 1.1, 4)  # Detect faces
@@ -57,7 +69,7 @@ def verify_face(known_face_bytes, check_image_bytes):
         check_nparr = np.frombuffer(check_image_bytes, np.uint8)
         check_full_img = cv2.imdecode(check_nparr, cv2.IMREAD_COLOR)
 
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')  # Load detector
+        face_cascade = _get_face_cascade()  # Load detector
         gray_check = cv2.cvtColor(check_full_img, cv2.COLOR_BGR2GRAY)
         faces = face_cascade.detectMultiScale(gray_check, 1.1, 4)
 
@@ -112,7 +124,7 @@ def identify_user(check_image_bytes, users_list):
         check_nparr = np.frombuffer(check_image_bytes, np.uint8)
         check_full_img = cv2.imdecode(check_nparr, cv2.IMREAD_COLOR)
 
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        face_cascade = _get_face_cascade()
         gray_check = cv2.cvtColor(check_full_img, cv2.COLOR_BGR2GRAY)
         faces = face_cascade.detectMultiScale(gray_check, 1.1, 4)
 
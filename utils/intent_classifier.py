@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+from utils import intents
+
+# Second NLU tier: a character n-gram TF-IDF + softmax regression model, trained in-process
+# from the bundled corpus. It runs when the grammar in utils/intents.py finds nothing and
+# only answers when it is confident, so everything else still escalates to Gemini.
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "intent_corpus.json")
+CONFIDENCE_THRESHOLD = 0.6
+OUT_OF_SCOPE = "out_of_scope"
+
+# Label "intent/value" -> which param the value fills
+LABEL_PARAM = {"navigation": "folder_name", "confirmation": "value"}
+
+# Slot handling is shared with the grammar so both tiers produce identical params
+_SLOT_RULES = {}
+for _rule in intents.INTENT_GRAMMAR:
+    if _rule.get("slot") and _rule["intent"] not in _SLOT_RULES:
+        _SLOT_RULES[_rule["intent"]] = _rule
+
+def char_ngrams(text, n_min=2, n_max=4):
+    """
+    Character n-grams of the normalized text, padded with spaces so word edges count.
+    Digits collapse to '#' so "email 7" looks like "email 2".
+    """
+    text = " " + re.sub(r"\d", "#", intents.normalize_utterance(text)) + " "
+    return [text[i:i + n] for n in range(n_min, n_max + 1) for i in range(len(text) - n + 1)]
+
+class IntentClassifier:
+    """
+    TF-IDF over character n-grams with a multinomial logistic regression head (NumPy only).
+    """
+
+    def __init__(self, epochs=250, learning_rate=30.0, l2=1e-4):
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.vocab = {}
+        self.idf = None
+        self.weights = None
+        self.bias = None
+        self.labels = []
+
+    def _features(self, text):
+        """
+        Sparse TF-IDF vector as (column indices, L2-normalized values).
+        """
+        counts = {}
+        for gram in char_ngrams(text):
+            col = self.vocab.get(gram)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        vals = (1.0 + np.log(tf)) * self.idf[cols]  # sublinear tf
+        return cols, vals / np.linalg.norm(vals)
+
+    def fit(self, utterances, labels):
+        self.labels = sorted(set(labels))
+        label_idx = {label: i for i, label in enumerate(self.labels)}
+
+        grams_per_doc = [set(char_ngrams(u)) for u in utterances]
+        for grams in grams_per_doc:
+            for gram in grams:
+                if gram not in self.vocab:
+                    self.vocab[gram] = len(self.vocab)
+
+        n, d, k = len(utterances), len(self.vocab), len(self.labels)
+        df = np.zeros(d, dtype=np.float32)
+        for grams in grams_per_doc:
+            df[[self.vocab[g] for g in grams]] += 1
+        self.idf = (np.log((1 + n) / (1 + df)) + 1.0).astype(np.float32)
+
+        X = np.zeros((n, d), dtype=np.float32)
+        for row, u in enumerate(utterances):
+            cols, vals = self._features(u)
+            X[row, cols] = vals
+        Y = np.zeros((n, k), dtype=np.float32)
+        Y[np.arange(n), [label_idx[l] for l in labels]] = 1.0
+
+        # Full-batch gradient descent on softmax cross-entropy; the corpus is small enough
+        W = np.zeros((d, k), dtype=np.float32)
+        b = np.zeros(k, dtype=np.float32)
+        for _ in range(self.epochs):
+            P = _softmax(X @ W + b)
+            G = (P - Y) / n
+            W -= self.learning_rate * (X.T @ G + self.l2 * W)
+            b -= self.learning_rate * G.sum(axis=0)
+        self.weights, self.bias = W, b
+        return self
+
+    def predict(self, text):
+        """
+        Returns (label, probability). Label is None when no known n-gram occurs.
+        """
+        cols, vals = self._features(text)
+        if cols.size == 0:
+            return None, 0.0
+        probs = _softmax(vals @ self.weights[cols] + self.bias)
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best])
+
+def _softmax(z):
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    utterances, labels = [], []
+    for label, examples in data.items():
+        utterances.extend(examples)
+        labels.extend([label] * len(examples))
+    return utterances, labels
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+def get_classifier():
+    """
+    Returns the shared classifier, training it from the bundled corpus on first use.
+    """
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = IntentClassifier().fit(*load_corpus())
+    return _classifier
+
+def warm_up():
+    """
+    Trains the classifier in a background thread so the first command doesn't pay for it.
+    """
+    threading.Thread(target=get_classifier, daemon=True).start()
+
+def label_to_intent(label, text):
+    """
+    Builds the intent dict for a predicted label, running the intent's slot extractor.
+    Returns None when a required slot is missing.
+    """
+    intent, _, value = label.partition("/")
+    params = {LABEL_PARAM[intent]: value} if value else {}
+    rule = _SLOT_RULES.get(intent)
+    if rule:
+        found = intents.SLOT_EXTRACTORS[rule["slot"]](intents.normalize_utterance(text))
+        if found is None and rule.get("required"):
+            return None
+        params.update(found or {})
+    return {"intent": intent, "params": params}
+
+def classify(text, threshold=CONFIDENCE_THRESHOLD):
+    """
+    Returns (intent_dict, confidence). intent_dict is None if the model is unsure,
+    the utterance is out of scope, or a required slot is missing.
+    """
+    try:
+        label, confidence = get_classifier().predict(text)
+    except Exception as e:
+        print(f"Intent Classifier Error: {e}")
+        return None, 0.0
+    if label is None or label == OUT_OF_SCOPE or confidence < threshold:
+        return None, confidence
+    return label_to_intent(label, text), confidence
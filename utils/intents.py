@@ -0,0 +1,175 @@
+import re
+
+# --- DECLARATIVE INTENT GRAMMAR ---
+# Rules are listed in priority order: when several match, the earliest one wins.
+# Every pattern is matched on whole words against normalized text, so "it" never matches inside "edit".
+#   intent   - intent name returned to the app
+#   patterns - regex fragments (alternatives)
+#   params   - static params merged into the result
+#   slot     - optional slot extractor name (see SLOT_EXTRACTORS)
+#   required - if True the rule only applies when the slot was found
+#
+# ASR often hears "sent" as "send", so "send" only means the Sent folder next to folder words
+# ("open send", "send folder"); "send an email" is compose and "send it" is a confirmation.
+
+_EMAIL_WORDS = r"(?:e ?mail|mail|message|note)"
+# Negations outrank the yes words: "that is not right" / "not correct" must be a no
+_NEGATIONS = [r"no", r"nope", r"nah", r"not", r"isn ?t", r"don ?t", r"wrong", r"incorrect"]
+
+INTENT_GRAMMAR = [
+    {"intent": "cancel", "patterns": [r"cancel", r"never ?mind", r"forget it"]},
+    {"intent": "stop", "patterns": [r"stop", r"quiet", r"silence", r"shut up"]},
+    {"intent": "logout", "patterns": [r"log ?out", r"sign ?out", r"log me out"]},
+    {"intent": "compose_action", "patterns": [r"at", r"[\w.-]+@[\w.-]+"], "params": {"field": "recipient"},
+     "slot": "recipient", "required": True},
+    {"intent": "confirmation", "patterns": [r"(?<!not )(?<!don t )send (?:it|now)", r"go ahead and send"],
+     "params": {"value": "yes"}},
+    {"intent": "read_content", "patterns": [r"^(?:read|read it|read this|read the mail|read email|read the email|speak|read it out)$"]},
+    {"intent": "compose_start", "patterns": [
+        r"compose", r"new " + _EMAIL_WORDS,
+        r"(?:write|send|draft|start|create) (?:an? |a new |new )?" + _EMAIL_WORDS]},
+    {"intent": "reply_with_suggestion", "patterns": [r"reply with", r"option", r"suggestion"],
+     "slot": "index", "required": True},
+    {"intent": "summarize_email", "patterns": [r"summari[sz]e", r"summary", r"short(?:er|en)?", r"gist"],
+     "slot": "index_or_current"},
+    {"intent": "delete_email", "patterns": [r"delete", r"remove", r"(?:move|put|throw) (?:\w+ )*?(?:to|in|into) (?:the )?(?:trash|bin)"],
+     "slot": "delete_target"},
+    {"intent": "open_email", "patterns": [r"open", r"read", r"show", r"play"], "slot": "index", "required": True},
+    {"intent": "read_content", "patterns": [
+        r"(?:open|read|show|play) (?:this|that|the current|the open) (?:one|" + _EMAIL_WORDS + ")"]},
+    {"intent": "navigation", "patterns": [r"inbox", r"in box"], "params": {"folder_name": "Inbox"}},
+    {"intent": "navigation", "patterns": [
+        r"sent", r"outbox", r"out box",
+        r"(?:open|go to|show|check) (?:the |my )?send",
+        r"send (?:folder|items|box|mails)"], "params": {"folder_name": "Sent"}},
+    {"intent": "navigation", "patterns": [r"trash", r"bin", r"deleted"], "params": {"folder_name": "Trash"}},
+    {"intent": "navigation", "patterns": [r"drafts?"], "params": {"folder_name": "Drafts"}},
+    {"intent": "navigation", "patterns": [r"settings?", r"config\w*", r"preferences"], "params": {"folder_name": "Settings"}},
+    {"intent": "confirmation", "patterns": _NEGATIONS, "params": {"value": "no"}},
+    {"intent": "confirmation", "patterns": [r"yes", r"yeah", r"yep", r"correct", r"sure", r"confirm\w*", r"right"],
+     "params": {"value": "yes"}},
+]
+
+# --- SLOT EXTRACTION ---
+
+ORDINALS = {
+    "first": 0, "second": 1, "third": 2, "fourth": 3, "fifth": 4,
+    "sixth": 5, "seventh": 6, "eighth": 7, "ninth": 8, "tenth": 9,
+    "1st": 0, "2nd": 1, "3rd": 2, "4th": 3, "5th": 4,
+    "6th": 5, "7th": 6, "8th": 7, "9th": 8, "10th": 9,
+    "latest": 0, "newest": 0, "top": 0,
+}
+NUMBER_WORDS = {
+    "one": 0, "two": 1, "three": 2, "four": 3, "five": 4,
+    "six": 5, "seven": 6, "eight": 7, "nine": 8, "ten": 9,
+}
+
+_INDEX_RE = re.compile(r"\b(?:(\d+)|(" + "|".join(ORDINALS) + r")|(" + "|".join(NUMBER_WORDS) + r"))\b")
+_CURRENT_RE = re.compile(r"\b(?:this|it|current|that|open one)\b")
+_DEICTIC_RE = re.compile(r"\b(?:this|that|it|current|same|which|the open)\s+$")  # "this one" is not email 1
+_NEGATION_RE = re.compile(r"\b(?:" + "|".join(_NEGATIONS) + r")\b")
+_EMAIL_RE = re.compile(
+    r"\b([a-z0-9]+(?:\s*(?:\.|\bdot\b|\bunderscore\b|_|\bdash\b|\bhyphen\b|-)\s*[a-z0-9]+)*)"
+    r"\s*(?:@|\bat\b)\s*"
+    r"([a-z0-9-]+(?:\s*(?:\.|\bdot\b)\s*[a-z]{2,})+)\b"
+)
+
+def extract_index(text):
+    """
+    Returns a 0-based index from "email 3", "the third one", "number two"; None if absent.
+    """
+    for m in _INDEX_RE.finditer(text):
+        digits, ordinal, word = m.groups()
+        if digits:
+            return max(int(digits) - 1, 0)
+        if ordinal:
+            return ORDINALS[ordinal]
+        if word == "one" and _DEICTIC_RE.search(text[:m.start()]):
+            continue
+        return NUMBER_WORDS[word]
+    return None
+
+def is_negative(text):
+    """
+    True if the answer contains a negation ("no", "not right", "that's wrong", "don't send").
+    """
+    return bool(_NEGATION_RE.search(normalize_utterance(text or "")))
+
+def extract_email_address(text):
+    """
+    Converts spoken ("john dot doe at gmail dot com") or written addresses to "john.doe@gmail.com".
+    """
+    m = _EMAIL_RE.search(text)
+    if not m:
+        return None
+    address = f"{m.group(1)}@{m.group(2)}"
+    for spoken, char in ((r"\bdot\b", "."), (r"\bunderscore\b", "_"), (r"\b(?:dash|hyphen)\b", "-")):
+        address = re.sub(spoken, char, address)
+    return re.sub(r"\s+", "", address)
+
+def _slot_index(text):
+    idx = extract_index(text)
+    return {"index": idx} if idx is not None else None
+
+def _slot_index_or_current(text):
+    return _slot_index(text) or {"target": "current"}
+
+def _slot_delete_target(text):
+    found = _slot_index(text)
+    if found:
+        return found
+    if _CURRENT_RE.search(text):
+        return {"target": "current"}
+    return {}
+
+def _slot_recipient(text):
+    address = extract_email_address(text)
+    return {"value": address} if address else None
+
+SLOT_EXTRACTORS = {
+    "index": _slot_index,
+    "index_or_current": _slot_index_or_current,
+    "delete_target": _slot_delete_target,
+    "recipient": _slot_recipient,
+}
+
+# --- COMPILED MATCHER ---
+
+def compile_grammar(grammar):
+    """
+    Compiles the grammar into one regex: one optional lookahead group per rule, so a single
+    re.match() call reports every rule that occurs anywhere in the text.
+    """
+    parts = []
+    for i, rule in enumerate(grammar):
+        alternatives = "|".join(rule["patterns"])
+        parts.append(rf"(?=.*?\b(?P<r{i}>{alternatives})(?!\w))?")
+    return re.compile("".join(parts), re.DOTALL)
+
+_MATCHER = compile_grammar(INTENT_GRAMMAR)
+
+def normalize_utterance(text):
+    text = text.lower().replace("e-mail", "email")
+    text = re.sub(r"[^\w@.\s-]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(".").strip()
+
+def match_intent(text):
+    """
+    Resolves text against the grammar.
+    Returns (result_dict, rule_index) or ({"intent": "unknown", "params": {}}, None).
+    """
+    text = normalize_utterance(text or "")
+    m = _MATCHER.match(text)
+    for i, rule in enumerate(INTENT_GRAMMAR):
+        if m.group(f"r{i}") is None:
+            continue
+        params = dict(rule.get("params", {}))
+        slot = rule.get("slot")
+        if slot:
+            found = SLOT_EXTRACTORS[slot](text)
+            if found is None and rule.get("required"):
+                continue
+            params.update(found or {})
+        return {"intent": rule["intent"], "params": params}, i
+    return {"intent": "unknown", "params": {}}, None
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+import numpy as np
+
+# Offline barge-in detection: short phrases from the capture stream are compared against
+# recorded examples of "stop" / "cancel" with dynamic time warping over MFCC features
+# (NumPy only). Templates are learned from the user's own voice: whenever cloud recognition
+# hears exactly a keyword, that audio is kept as a new example (see voice.MicCapture).
+
+KEYWORDS = ("stop", "cancel")
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "userdata", "keywords")
+MAX_TEMPLATES = 5          # per keyword; the oldest example is replaced
+MAX_DISTANCE = 8.0         # mean per-frame MFCC distance along the DTW path; lower is stricter
+MIN_DURATION = 0.15        # seconds; keywords are short, longer phrases go to full recognition
+MAX_DURATION = 1.5
+
+FRAME_MS, HOP_MS = 25, 10
+N_FFT, N_MELS, N_CEPS = 512, 26, 13
+
+_filterbanks = {}
+
+def _mel_filterbank(rate):
+    if rate not in _filterbanks:
+        mel = lambda f: 2595 * np.log10(1 + f / 700.0)
+        hz = lambda m: 700 * (10 ** (m / 2595.0) - 1)
+        points = hz(np.linspace(mel(0), mel(rate / 2), N_MELS + 2))
+        bins = np.floor((N_FFT + 1) * points / rate).astype(int)
+        fb = np.zeros((N_MELS, N_FFT // 2 + 1), dtype=np.float32)
+        for m in range(1, N_MELS + 1):
+            left, center, right = bins[m - 1], bins[m], bins[m + 1]
+            for k in range(left, center):
+                fb[m - 1, k] = (k - left) / max(center - left, 1)
+            for k in range(center, right):
+                fb[m - 1, k] = (right - k) / max(right - center, 1)
+        n = np.arange(N_MELS)
+        dct = np.cos(np.pi / N_MELS * (n + 0.5)[None, :] * np.arange(N_CEPS)[:, None])
+        _filterbanks[rate] = (fb, dct.astype(np.float32))
+    return _filterbanks[rate]
+
+def trim_silence(samples, rate, floor=0.1):
+    """
+    Cuts leading/trailing audio quieter than floor x the loudest 10 ms block
+    (the capture thread pads every phrase with silence).
+    """
+    x = np.asarray(samples, dtype=np.float32)
+    hop = int(rate * HOP_MS / 1000)
+    if x.size < hop:
+        return x
+    blocks = x[:x.size - x.size % hop].reshape(-1, hop)
+    rms = np.sqrt((blocks ** 2).mean(axis=1))
+    loud = np.nonzero(rms >= floor * rms.max())[0]
+    if loud.size == 0:
+        return x[:0]
+    return x[loud[0] * hop:(loud[-1] + 1) * hop]
+
+def mfcc(samples, rate):
+    """
+    (frames, N_CEPS - 1) MFCCs of int16/float mono samples, without c0 and mean-normalized,
+    so loudness and microphone coloring mostly cancel out.
+    """
+    x = np.asarray(samples, dtype=np.float32)
+    x = np.append(x[0], x[1:] - 0.97 * x[:-1])  # pre-emphasis
+    frame, hop = int(rate * FRAME_MS / 1000), int(rate * HOP_MS / 1000)
+    if x.size < frame:
+        x = np.pad(x, (0, frame - x.size))
+    count = 1 + (x.size - frame) // hop
+    idx = np.arange(frame)[None, :] + hop * np.arange(count)[:, None]
+    frames = x[idx] * np.hamming(frame).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames, N_FFT)) ** 2 / N_FFT
+    fb, dct = _mel_filterbank(rate)
+    logmel = np.log(power @ fb.T + 1e-6)
+    ceps = logmel @ dct.T
+    ceps = ceps[:, 1:]
+    return ceps - ceps.mean(axis=0)
+
+def dtw_distance(a, b):
+    """
+    DTW alignment cost between two feature sequences, normalized by their combined length.
+    """
+    cost = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+    n, m = cost.shape
+    acc = np.full((n + 1, m + 1), np.inf, dtype=np.float64)
+    acc[0, 0] = 0.0
+    for i in range(1, n + 1):
+        row, prev, c = acc[i], acc[i - 1], cost[i - 1]
+        # Diagonal / vertical steps vectorized; horizontal steps need the running row
+        best = np.minimum(prev[1:], prev[:-1]) + c
+        for j in range(1, m + 1):
+            row[j] = min(best[j - 1], row[j - 1] + c[j - 1])
+    return acc[n, m] / (n + m)
+
+class KeywordSpotter:
+    """
+    Template matcher for a few fixed words. Thread-safe.
+    """
+
+    def __init__(self, keywords=KEYWORDS, template_dir=TEMPLATE_DIR, max_distance=MAX_DISTANCE):
+        self.keywords = tuple(keywords)
+        self.template_dir = template_dir
+        self.max_distance = max_distance
+        self._templates = {k: [] for k in self.keywords}  # keyword -> [(path, features)]
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.template_dir):
+            return
+        for name in sorted(os.listdir(self.template_dir)):
+            keyword = name.split("_", 1)[0]
+            if name.endswith(".npy") and keyword in self._templates:
+                path = os.path.join(self.template_dir, name)
+                try:
+                    self._templates[keyword].append((path, np.load(path)))
+                except Exception as e:
+                    print(f"Keyword Template Error ({name}): {e}")
+        for keyword, items in self._templates.items():
+            del items[:-MAX_TEMPLATES]
+
+    def available(self):
+        """
+        True once at least one keyword has an example to match against.
+        """
+        with self._lock:
+            return any(self._templates.values())
+
+    def detect(self, samples, rate):
+        """
+        Returns the keyword spoken in samples, or None. Takes a few milliseconds per template.
+        """
+        samples = trim_silence(samples, rate)
+        duration = len(samples) / float(rate)
+        if not (MIN_DURATION <= duration <= MAX_DURATION):
+            return None
+        with self._lock:
+            templates = [(k, feats) for k, items in self._templates.items() for _, feats in items]
+        if not templates:
+            return None
+        features = mfcc(samples, rate)
+        best, best_distance = None, self.max_distance
+        for keyword, template in templates:
+            distance = dtw_distance(features, template)
+            if distance < best_distance:
+                best, best_distance = keyword, distance
+        return best
+
+    def add_template(self, keyword, samples, rate):
+        """
+        Stores samples as a new example of keyword (persisted to template_dir).
+        """
+        if keyword not in self._templates:
+            return
+        samples = trim_silence(samples, rate)
+        duration = len(samples) / float(rate)
+        if not (MIN_DURATION <= duration <= MAX_DURATION):
+            return
+        features = mfcc(samples, rate).astype(np.float32)
+        os.makedirs(self.template_dir, exist_ok=True)
+        path = os.path.join(self.template_dir, f"{keyword}_{int(time.time() * 1000)}.npy")
+        np.save(path, features)
+        with self._lock:
+            items = self._templates[keyword]
+            items.append((path, features))
+            while len(items) > MAX_TEMPLATES:
+                old_path, _ = items.pop(0)
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        print(f"Keyword Spotter: learned a new '{keyword}' example")
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class LLMUnavailable(Exception):
+    """
+    Raised instead of calling the API while the circuit breaker is open.
+    """
+
+class LLMGuard:
+    """
+    Wraps remote model calls with:
+    - a hard deadline per call (TimeoutError once it passes; the stray request finishes in the background),
+    - an optional hedged duplicate request, sent when the first one is slower than the recent p95,
+    - a circuit breaker: after failure_threshold consecutive failures every call fails fast with
+      LLMUnavailable for cooldown seconds, then a single trial call decides whether to close again.
+    """
+
+    def __init__(self, deadline=3.0, hedge_delay=1.0, min_hedge_delay=0.3, failure_threshold=3,
+                 cooldown=30.0, max_workers=8, latency_window=100):
+        self.deadline = deadline
+        self.hedge_delay = hedge_delay          # Used until enough latency samples exist
+        self.min_hedge_delay = min_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.counters = {"calls": 0, "successes": 0, "errors": 0, "timeouts": 0,
+                         "hedges": 0, "hedge_wins": 0, "breaker_trips": 0, "short_circuits": 0}
+
+    # --- circuit breaker ---
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.time() - self._opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def available(self):
+        """
+        True if a call would be attempted right now.
+        """
+        with self._lock:
+            state = self._state()
+            return state == "closed" or (state == "half_open" and not self._trial_running)
+
+    def _admit(self):
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half_open" and self._trial_running):
+                self.counters["short_circuits"] += 1
+                raise LLMUnavailable("LLM circuit breaker is open")
+            if state == "half_open":
+                self._trial_running = True
+            self.counters["calls"] += 1
+
+    def record_success(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+            self.counters["successes"] += 1
+
+    def record_failure(self, timed_out=False):
+        with self._lock:
+            self.counters["timeouts" if timed_out else "errors"] += 1
+            self._failures += 1
+            if self._trial_running:
+                # Trial call after the cooldown failed: stay open for another cooldown
+                self._trial_running = False
+                self._opened_at = time.time()
+                self.counters["breaker_trips"] += 1
+            elif self._opened_at is None and self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+                self.counters["breaker_trips"] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    # --- latency ---
+
+    def p95(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def current_hedge_delay(self):
+        p95 = self.p95() if len(self._latencies) >= 20 else None
+        return max(self.min_hedge_delay, p95 if p95 is not None else self.hedge_delay)
+
+    # --- calls ---
+
+    def call(self, fn, deadline=None, hedge=False):
+        """
+        Runs fn() (a blocking API call) within the deadline and returns its result.
+        Raises LLMUnavailable, TimeoutError, or the error raised by fn.
+        """
+        self._admit()
+        recorded = False  # Whether this call's outcome reached the breaker
+        try:
+            deadline = deadline or self.deadline
+            start = time.time()
+            end = start + deadline
+            futures = [self._pool.submit(fn)]
+            error = None
+
+            if hedge:
+                delay = self.current_hedge_delay()
+                if delay < deadline:
+                    done, _ = wait(futures, timeout=delay)
+                    if not done:
+                        self._count("hedges")
+                        futures.append(self._pool.submit(fn))
+
+            pending = set(futures)
+            while pending:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        if len(futures) > 1 and f is futures[1]:
+                            self._count("hedge_wins")
+                        recorded = True
+                        self.record_success(time.time() - start)
+                        return f.result()
+                    error = f.exception()
+
+            recorded = True
+            if error is not None and not pending:
+                self.record_failure()
+                raise error
+            self.record_failure(timed_out=True)
+            raise TimeoutError(f"LLM call exceeded {deadline:.1f}s deadline")
+        except BaseException:
+            # Anything failing around fn (e.g. the pool refusing work at shutdown) still counts,
+            # otherwise a half-open trial would stay pending and the breaker never close
+            if not recorded:
+                self.record_failure()
+            raise
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            state = self._state()
+        counters["breaker_state"] = state
+        counters["p95_latency"] = self.p95()
+        return counters
@@ -0,0 +1,80 @@
+import threading
+import time
+import speech_recognition as sr
+from utils import db
+
+# Ambient-noise calibration per input device. The energy threshold is measured once (or taken
+# from the database on later starts), then follows speech_recognition's dynamic adjustment,
+# which adapts on non-speech audio while the capture thread listens. Drifted values are saved
+# back so the next start begins from the room's current level.
+
+CALIBRATION_SECONDS = 0.5
+DEFAULT_THRESHOLD = 300.0   # speech_recognition's own starting value
+BARGE_IN_FACTOR = 3.0       # While the assistant talks, only speech this much louder counts
+SAVE_DRIFT = 0.15           # Persist once the threshold moved more than 15% ...
+SAVE_INTERVAL = 60.0        # ... and at most once a minute
+
+def device_name(device_index=None):
+    if device_index is None:
+        return "default"
+    try:
+        return sr.Microphone.list_microphone_names()[device_index]
+    except Exception:
+        return f"device-{device_index}"
+
+class Calibration:
+    """
+    Energy threshold of one microphone, kept in memory and in the mic_calibration table.
+    """
+
+    def __init__(self, device="default"):
+        self.device = device
+        self.energy_threshold = None
+        self._saved = None
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Takes the stored threshold for this device. Returns False if there is none yet.
+        """
+        try:
+            stored = db.get_mic_calibration(self.device)
+        except Exception as e:
+            print(f"Calibration Load Error: {e}")
+            return False
+        if stored is None:
+            return False
+        with self._lock:
+            self.energy_threshold = self._saved = stored
+            self._saved_at = time.time()
+        print(f"Microphone '{self.device}': stored energy threshold {stored:.0f}")
+        return True
+
+    def measure(self, recognizer, source, duration=CALIBRATION_SECONDS):
+        recognizer.adjust_for_ambient_noise(source, duration=duration)
+        self.update(recognizer.energy_threshold, force=True)
+        print(f"Microphone '{self.device}': measured energy threshold {self.energy_threshold:.0f}")
+
+    def apply(self, recognizer):
+        if self.energy_threshold:
+            recognizer.energy_threshold = self.energy_threshold
+
+    def update(self, energy_threshold, force=False):
+        """
+        Records the current (adapted) threshold and persists it when it has drifted enough.
+        """
+        with self._lock:
+            self.energy_threshold = energy_threshold
+            drifted = self._saved is None or abs(energy_threshold - self._saved) > SAVE_DRIFT * self._saved
+            due = force or (drifted and time.time() - self._saved_at >= SAVE_INTERVAL)
+            if due:
+                self._saved, self._saved_at = energy_threshold, time.time()
+        if due:
+            try:
+                db.save_mic_calibration(self.device, energy_threshold)
+            except Exception as e:
+                print(f"Calibration Save Error: {e}")
+
+    def barge_in_threshold(self):
+        return (self.energy_threshold or DEFAULT_THRESHOLD) * BARGE_IN_FACTOR
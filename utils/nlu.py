@@ -2,37 +2,41 @@ import google.generativeai as genai
 import json
 import re
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.cache import ResponseCache
+from utils import intents, intent_classifier, tracing
+from utils.llm_guard import LLMGuard
 
 # Default fallback if not configured
 API_KEY = None
+MODEL_NAME = 'gemini-1.5-flash'
 
-def configure_genai(api_key):
-    global API_KEY
-    API_KEY = api_key
-    genai.configure(api_key=API_KEY)
+# Bump whenever PARSE_PROMPT changes so cached parses from the old prompt are ignored
+PROMPT_VERSION = 1
 
-def parse_command(text):
-    """
-    Parses natural language text into a structured intent using Gemini Flash.
-    Returns dict: {"intent": "str", "params": {}}
-    """
-    if not text:
-        return None
+PARSE_CACHE_SIZE = 1024
+PARSE_CACHE_TTL = 7 * 24 * 3600  # seconds
 
-    # Fallback if no API key
-    if not API_KEY:
-        return regex_fallback(text)
+_model = None  # Shared GenerativeModel handle
 
-    # OPTIMIZATION: Check regex first for common commands to avoid API latency
-    quick_check = regex_fallback(text)
-    if quick_check and quick_check.get("intent") != "unknown":
-        print(f"NLU (Fast Path): {quick_check}")
-        return quick_check
+# Hard latency bounds for Gemini. Command parsing sits inside the voice turn, so it gets a short
+# deadline plus a hedged retry; summaries/replies run off the turn and may take longer.
+# Each kind has its own guard: long generations must not raise the parse p95 (which would stop
+# hedging) and a breaker opened by background enrichment must not push parsing onto the fallback.
+PARSE_DEADLINE = 2.5      # seconds
+GENERATE_DEADLINE = 15.0  # seconds
+_parse_guard = LLMGuard(deadline=PARSE_DEADLINE)
+_generate_guard = LLMGuard(deadline=GENERATE_DEADLINE)
 
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        prompt = f"""
+# Speculative parsing: local classifier results at or above this are reported as tentative intents
+EARLY_INTENT_THRESHOLD = 0.35
+_spec_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="nlu-spec")
+_spec_counters = {"started": 0, "used": 0}
+_tier_counts = {"grammar": 0, "cache": 0, "classifier": 0, "llm": 0, "fallback": 0}
+_parse_cache = ResponseCache(max_entries=PARSE_CACHE_SIZE, ttl=PARSE_CACHE_TTL, namespace="parse")
+
+PARSE_PROMPT = """
         You are a voice assistant NLU. valid intents: 
         - navigation (params: folder_name [Inbox, Sent, Trash, Drafts, Settings])
         - open_email (params: index [integer 0-based], target [optional "latest", "first"])
@@ -41,8 +45,6 @@ def parse_command(text):
         - compose_action (params: field [recipient, subject, message], value [string - sanitized for email if recipient])
         - confirmation (params: value [yes, no])
         - stop (no params)
-        - confirmation (params: value [yes, no])
-        - stop (no params)
         - summarize_email (params: index [integer 0-based], target [optional "current"])
         - reply_with_suggestion (params: index [integer 0-based])
         
@@ -54,104 +56,197 @@ def parse_command(text):
         User: "{text}"
         JSON:
         """
-        
-        response = model.generate_content(prompt)
-        # Clean response (sometimes contains markdown ```json ... ```)
-        raw = response.text.strip()
-        if raw.startswith("```"):
-            raw = raw.split("\n", 1)[1].rsplit("\n", 1)[0]
-            
-        data = json.loads(raw)
+
+def configure_genai(api_key, cache_db_path=None):
+    """
+    Sets the API key. If cache_db_path is given, parse results are also persisted there.
+    """
+    global API_KEY, _model, _parse_cache
+    API_KEY = api_key
+    genai.configure(api_key=API_KEY)
+    _model = None
+    if cache_db_path:
+        _parse_cache = ResponseCache(max_entries=PARSE_CACHE_SIZE, ttl=PARSE_CACHE_TTL,
+                                     db_path=cache_db_path, namespace="parse")
+
+def get_model():
+    """
+    Returns the shared Gemini model handle, created on first use.
+    """
+    global _model
+    if _model is None:
+        _model = genai.GenerativeModel(MODEL_NAME)
+    return _model
+
+@tracing.traced("gemini.generate")
+def generate(prompt, deadline=GENERATE_DEADLINE, hedge=False, guard=None):
+    """
+    Calls Gemini through a latency guard (deadline, optional hedging, circuit breaker);
+    the long-form generation guard unless another is given.
+    Raises TimeoutError / LLMUnavailable / API errors; callers fall back locally.
+    """
+    request_options = {"timeout": deadline}
+    guard = guard or _generate_guard
+    return guard.call(lambda: get_model().generate_content(prompt, request_options=request_options),
+                      deadline=deadline, hedge=hedge)
+
+def llm_available():
+    """
+    False while the generation circuit breaker is open (API considered unhealthy).
+    """
+    return bool(API_KEY) and _generate_guard.available()
+
+def get_llm_stats():
+    return {"parse": _parse_guard.stats(), "generate": _generate_guard.stats()}
+
+def _parse_cache_key(text):
+    return f"v{PROMPT_VERSION}:{MODEL_NAME}:{intents.normalize_utterance(text)}"
+
+def warm_up_local_models():
+    """
+    Starts training the local intent classifier in the background.
+    """
+    intent_classifier.warm_up()
+
+def get_cache_stats():
+    return _parse_cache.stats()
+
+def _llm_parse(text):
+    """
+    Gemini tier of parse_command. Caches valid results; raises on any failure.
+    """
+    response = generate(PARSE_PROMPT.format(text=text), deadline=PARSE_DEADLINE, hedge=True,
+                        guard=_parse_guard)
+    # Clean response (sometimes contains markdown ```json ... ```)
+    raw = response.text.strip()
+    if raw.startswith("```"):
+        raw = raw.split("\n", 1)[1].rsplit("\n", 1)[0]
+
+    data = json.loads(raw)
+    if isinstance(data, dict) and data.get("intent"):
+        _parse_cache.set(_parse_cache_key(text), data)
+    return data
+
+def get_speculation_stats():
+    return dict(_spec_counters)
+
+def _count_tier(tier):
+    _tier_counts[tier] += 1
+    tracing.annotate(tier=tier)
+
+def get_tier_stats():
+    """
+    How many parse_command calls each tier answered: grammar, cache, classifier, llm, fallback.
+    """
+    return dict(_tier_counts)
+
+tracing.add_counter("swar_nlu_tier_total", "tier", get_tier_stats, "parse_command calls answered by each NLU tier.")
+
+@tracing.traced("nlu.parse_command")
+def parse_command(text, speculative=False, on_early_intent=None):
+    """
+    Parses natural language text into a structured intent.
+    Tiers: compiled grammar -> cache -> local classifier -> Gemini Flash.
+    Returns dict: {"intent": "str", "params": {}}
+
+    speculative=True sends the Gemini request off the calling thread as soon as the
+    classifier turns out unsure, so that when only a tentative local intent exists,
+    on_early_intent(intent_dict) runs while Gemini is still confirming it: the caller can
+    start read-only work (e.g. prefetching a folder) in the meantime.
+    """
+    if not text:
+        return None
+
+    # OPTIMIZATION: Check regex first for common commands to avoid API latency
+    quick_check = regex_fallback(text)
+    if quick_check and quick_check.get("intent") != "unknown":
+        print(f"NLU (Fast Path): {quick_check}")
+        _count_tier("grammar")
+        return quick_check
+
+    # Repeated phrasings skip the API entirely
+    if API_KEY:
+        cached = _parse_cache.get(_parse_cache_key(text))
+        if cached is not None:
+            print(f"NLU (Cache): {cached}")
+            _count_tier("cache")
+            return cached
+
+    # Second tier: local classifier (well under a millisecond), only trusted above its confidence threshold
+    local, confidence = intent_classifier.classify(text, threshold=EARLY_INTENT_THRESHOLD)
+    if local and confidence >= intent_classifier.CONFIDENCE_THRESHOLD:
+        print(f"NLU (Local Model {confidence:.2f}): {local}")
+        _count_tier("classifier")
+        return local
+
+    # Fallback if no API key
+    if not API_KEY:
+        _count_tier("fallback")
+        return quick_check
+
+    if not _parse_guard.available():
+        print("NLU: Gemini circuit open, using local fallback")
+        _count_tier("fallback")
+        return quick_check
+
+    # Local confidence is low: Gemini decides. Speculatively, it runs while on_early_intent works
+    llm_future = None
+    if speculative:
+        llm_future = _spec_pool.submit(tracing.bind(_llm_parse), text)
+        _spec_counters["started"] += 1
+
+    if local and on_early_intent:
+        print(f"NLU (Tentative {confidence:.2f}): {local}")
+        try:
+            on_early_intent(local)
+        except Exception as e:
+            print(f"Early Intent Error: {e}")
+
+    try:
+        if llm_future is not None:
+            data = llm_future.result()
+            _spec_counters["used"] += 1
+        else:
+            data = _llm_parse(text)
+        _count_tier("llm")
         return data
 
     except Exception as e:
         print(f"NLU Error: {e}")
+        _count_tier("fallback")
         return regex_fallback(text)
 
 def regex_fallback(text):
-    text = text.lower()
-    if "cancel" in text: return {"intent": "cancel", "params": {}}
-    if "inbox" in text: return {"intent": "navigation", "params": {"folder_name": "Inbox"}}
-    if "inbox" in text: return {"intent": "navigation", "params": {"folder_name": "Inbox"}}
-    
-    # "Sent" synonyms (sometimes heard as 'send')
-    if "sent" in text or "send" in text or "outbox" in text: 
-        return {"intent": "navigation", "params": {"folder_name": "Sent"}}
-    
-    if "trash" in text or "bin" in text: return {"intent": "navigation", "params": {"folder_name": "Trash"}}
-    
-    if "draft" in text: return {"intent": "navigation", "params": {"folder_name": "Drafts"}}
-    
-    if "setting" in text or "config" in text: return {"intent": "navigation", "params": {"folder_name": "Settings"}}
-    
-    # Read Content explicitly
-    if text in ["read", "read it", "read the mail", "read email", "speak"]:
-        return {"intent": "read_content", "params": {}}
-    
-    # Delete Email
-    if "delete" in text or "remove" in text or "trash" in text:
-        # Check for numeric index "delete email 5"
-        nums = re.findall(r'\d+', text)
-        if nums:
-             return {"intent": "delete_email", "params": {"index": int(nums[0])-1}}
-        
-        # Check for context "delete this"
-        if "this" in text or "it" in text or "current" in text:
-             return {"intent": "delete_email", "params": {"target": "current"}}
-             
-        # Just "delete" usually means current if reading
-        return {"intent": "delete_email", "params": {}}
-    
-    # Open / Read
-    
-    # Open / Read
-    if "open" in text or "read" in text:
-        nums = re.findall(r'\d+', text)
-        if nums:
-            return {"intent": "open_email", "params": {"index": int(nums[0])-1}}
-        
-        ordinals = {
-            "first": 0, "second": 1, "third": 2, "fourth": 3, "fifth": 4,
-            "sixth": 5, "seventh": 6, "eighth": 7, "ninth": 8, "tenth": 9,
-            "one": 0, "two": 1, "three": 2, "four": 3, "five": 4
-        }
-        for word, idx in ordinals.items():
-            if word in text:
-                return {"intent": "open_email", "params": {"index": idx}}
-            
-        if "compose" in text: return {"intent": "compose_start", "params": {}}
-    if "yes" in text or "send it" in text: return {"intent": "confirmation", "params": {"value": "yes"}}
-    if "logout" in text or "sign out" in text: return {"intent": "logout", "params": {}}
-    if "stop" in text or "quiet" in text: return {"intent": "stop", "params": {}}
-
-    # Summarize
-    if "summarize" in text or "summary" in text or "short" in text:
-        nums = re.findall(r'\d+', text)
-        if nums:
-             return {"intent": "summarize_email", "params": {"index": int(nums[0])-1}}
-        
-        ordinals = {
-            "first": 0, "second": 1, "third": 2, "fourth": 3, "fifth": 4,
-            "sixth": 5, "seventh": 6, "eighth": 7, "ninth": 8, "tenth": 9,
-            "one": 0, "two": 1, "three": 2, "four": 3, "five": 4
-        }
-        for word, idx in ordinals.items():
-            if word in text:
-                return {"intent": "summarize_email", "params": {"index": idx}}
-                
-        # If open, summarize active
-        return {"intent": "summarize_email", "params": {"target": "current"}}
-        
-    # Suggested Replies
-    if "reply with" in text or "option" in text:
-        nums = re.findall(r'\d+', text)
-        if nums:
-             return {"intent": "reply_with_suggestion", "params": {"index": int(nums[0])-1}}
-        if "one" in text: return {"intent": "reply_with_suggestion", "params": {"index": 0}}
-        if "two" in text: return {"intent": "reply_with_suggestion", "params": {"index": 1}}
-        if "three" in text: return {"intent": "reply_with_suggestion", "params": {"index": 2}}
-    
-    return {"intent": "unknown", "params": {}}
+    """
+    Local fast path: resolves text with the compiled intent grammar (utils/intents.py).
+    Returns {"intent": "unknown", "params": {}} when nothing matches.
+    """
+    result, _ = intents.match_intent(text)
+    return result
+
+# Bump these when the prompt below changes; precomputed results keyed on them are then recomputed
+SUMMARY_PROMPT_VERSION = 1
+REPLIES_PROMPT_VERSION = 1
+
+SUMMARY_PROMPT = "Summarize the following email content in 2 sentences, capturing the main point and any action items:\n\n{text}"
+
+# A sentence ends at . ! or ? followed by whitespace (the last sentence may end the stream without it)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def split_sentences(chunks):
+    """
+    Re-chunks a stream of text fragments into complete sentences as soon as each one is closed.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk.replace("\n", " ")
+        parts = _SENTENCE_END.split(buffer)
+        buffer = parts.pop()
+        for sentence in parts:
+            if sentence.strip():
+                yield sentence.strip()
+    if buffer.strip():
+        yield buffer.strip()
 
 def summarize_email_content(text):
     """
@@ -161,25 +256,46 @@ def summarize_email_content(text):
     if not API_KEY: return "AI key missing. Cannot summarize."
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = f"Summarize the following email content in 2 sentences, capturing the main point and any action items:\n\n{text}"
-        response = model.generate_content(prompt)
+        response = generate(SUMMARY_PROMPT.format(text=text))
         return response.text.replace("\n", " ")
     except Exception as e:
         print(f"Summary Error: {e}")
         return "Failed to generate summary."
 
-def generate_suggested_replies(text):
+def stream_email_summary(text):
     """
-    Generates 3 short suggested replies for the given email text.
-    Returns list of strings.
+    Streaming variant of summarize_email_content: yields complete sentences while
+    Gemini is still generating, so speech can start on the first one.
     """
-    if not text: return []
-    if not API_KEY: return []
-    
+    if not text:
+        yield "No content to summarize."
+        return
+    if not API_KEY:
+        yield "AI key missing. Cannot summarize."
+        return
+
+    if not _generate_guard.available():
+        yield "Summaries are unavailable right now."
+        return
+
+    produced = False
+    start = time.time()
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        prompt = f"""
+        # Streaming can't be hedged; the deadline bounds the wait for the first chunk
+        response = get_model().generate_content(SUMMARY_PROMPT.format(text=text), stream=True,
+                                                request_options={"timeout": GENERATE_DEADLINE})
+        for sentence in split_sentences(chunk.text for chunk in response):
+            if not produced:
+                _generate_guard.record_success(time.time() - start)
+            produced = True
+            yield sentence
+    except Exception as e:
+        print(f"Summary Stream Error: {e}")
+        if not produced:
+            _generate_guard.record_failure()
+            yield "Failed to generate summary."
+
+REPLIES_PROMPT = """
         Read the following email and generate 3 short, polite, and distinct suggested replies (under 10 words each). 
         Return them as a JSON list of strings, e.g. ["Yes, sure.", "No thanks.", "I will check."]
         
@@ -187,12 +303,113 @@ def generate_suggested_replies(text):
         
         JSON:
         """
-        response = model.generate_content(prompt)
-        raw = response.text.replace("```json", "").replace("```", "").strip()
-        data = json.loads(raw)
-        if isinstance(data, list):
-            return data[:3]
-        return []
+
+def _parse_replies(raw):
+    raw = raw.replace("```json", "").replace("```", "").strip()
+    data = json.loads(raw)
+    if isinstance(data, list):
+        return [str(r) for r in data[:3]]
+    return []
+
+def generate_suggested_replies(text):
+    """
+    Generates 3 short suggested replies for the given email text.
+    Returns list of strings.
+    """
+    if not text: return []
+    if not API_KEY: return []
+    
+    try:
+        response = generate(REPLIES_PROMPT.format(text=text))
+        return _parse_replies(response.text)
     except Exception as e:
         print(f"Suggest Reply Error: {e}")
         return []
+
+def enrich_email(text):
+    """
+    Summary and suggested replies for one email: {"summary": str, "replies": [str]}.
+    Unlike the functions above this raises on API / parse errors, so failures are never cached.
+    """
+    summary = generate(SUMMARY_PROMPT.format(text=text)).text.replace("\n", " ").strip()
+    replies = _parse_replies(generate(REPLIES_PROMPT.format(text=text)).text)
+    return {"summary": summary, "replies": replies}
+
+# Several emails per request. Produces the same fields as SUMMARY_PROMPT + REPLIES_PROMPT,
+# so keep it in step with them (and bump their versions) when editing.
+BATCH_ENRICH_PROMPT = """
+        You will receive several emails, each introduced by a line "### EMAIL <id>".
+        For EACH email write a 2 sentence summary capturing the main point and any action items,
+        and 3 short, polite, and distinct suggested replies (under 10 words each).
+        Return ONLY a JSON object mapping every id to {{"summary": "...", "replies": ["...", "...", "..."]}}.
+
+        {emails}
+
+        JSON:
+        """
+BATCH_SIZE = 5               # Emails per request
+BATCH_MAX_CHARS = 3000       # Per-email truncation to keep the prompt bounded
+
+def _validate_enrichment(item):
+    """
+    Returns a clean {"summary", "replies"} dict, or None if item is malformed.
+    """
+    if not isinstance(item, dict):
+        return None
+    summary = item.get("summary")
+    replies = item.get("replies")
+    if not isinstance(summary, str) or not summary.strip() or not isinstance(replies, list):
+        return None
+    return {"summary": summary.replace("\n", " ").strip(), "replies": [str(r) for r in replies[:3]]}
+
+def _parse_batch_response(raw):
+    """
+    Extracts {id: item} from the model output. Tolerates markdown fences, text around the JSON,
+    and a list of {"id": ...} objects instead of a mapping.
+    """
+    raw = raw.replace("```json", "").replace("```", "")
+    start, end = raw.find("{"), raw.rfind("}")
+    list_start = raw.find("[")
+    if list_start != -1 and (start == -1 or list_start < start):
+        start, end = list_start, raw.rfind("]")
+    if start == -1 or end <= start:
+        return {}
+    data = json.loads(raw[start:end + 1])
+    if isinstance(data, list):
+        data = {str(item.get("id")): item for item in data if isinstance(item, dict)}
+    return {str(k): v for k, v in data.items()} if isinstance(data, dict) else {}
+
+def enrich_emails_batch(emails):
+    """
+    Summaries and suggested replies for many emails using one request per BATCH_SIZE emails.
+    emails: list of (message_id, text). Returns {message_id: {"summary", "replies"}}.
+    Items missing or malformed in the batch output are retried one by one with enrich_email;
+    items that still fail are left out.
+    """
+    results = {}
+    if not API_KEY:
+        return results
+
+    for i in range(0, len(emails), BATCH_SIZE):
+        batch = [(str(mid), text) for mid, text in emails[i:i + BATCH_SIZE] if text]
+        if not batch:
+            continue
+
+        parsed = {}
+        try:
+            block = "\n\n".join(f"### EMAIL {mid}\n{text[:BATCH_MAX_CHARS]}" for mid, text in batch)
+            response = generate(BATCH_ENRICH_PROMPT.format(emails=block))
+            parsed = _parse_batch_response(response.text)
+        except Exception as e:
+            print(f"Batch Enrich Error: {e}")
+
+        for mid, text in batch:
+            item = _validate_enrichment(parsed.get(mid))
+            if item is None:
+                try:
+                    item = enrich_email(text)
+                except Exception as e:
+                    print(f"Enrich Error ({mid}): {e}")
+                    continue
+            results[mid] = item
+    return results
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+
+# Pre-rendered WAVs for short phrases the assistant says over and over ("Opening Inbox",
+# "Stopped.", ...). They are synthesized once by a separate `speak.py --render` process
+# and afterwards played straight from disk, skipping synthesis entirely.
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompt_audio")
+MAX_PROMPT_CHARS = 120   # Longer text is never cached
+RENDER_AFTER_USES = 3    # Other phrases get rendered once they have been spoken this often
+SPEAK_SCRIPT = os.path.join(os.path.dirname(__file__), "speak.py")
+
+_cache_dir = CACHE_DIR
+_ready = {}        # key -> wav path
+_uses = {}         # key -> times spoken via TTS
+_rendering = set()
+_lock = threading.Lock()
+
+def prompt_key(text, voice=None, rate=None):
+    raw = f"{voice or 'default'}|{rate or 'default'}|{text.strip()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+def configure(cache_dir=CACHE_DIR):
+    """
+    Sets the cache directory and indexes the WAVs already rendered there.
+    """
+    global _cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    with _lock:
+        _cache_dir = cache_dir
+        _ready.clear()
+        for name in os.listdir(cache_dir):
+            if name.endswith(".wav"):
+                _ready[name[:-4]] = os.path.join(cache_dir, name)
+
+def lookup(text, voice=None, rate=None):
+    """
+    Returns the path of the rendered WAV for text, or None.
+    """
+    if not text or len(text) > MAX_PROMPT_CHARS:
+        return None
+    with _lock:
+        return _ready.get(prompt_key(text, voice, rate))
+
+def note_spoken(text, voice=None, rate=None):
+    """
+    Counts a TTS use of text and schedules rendering once it has become a repeated phrase.
+    """
+    if not text or len(text) > MAX_PROMPT_CHARS:
+        return
+    key = prompt_key(text, voice, rate)
+    with _lock:
+        _uses[key] = _uses.get(key, 0) + 1
+        due = _uses[key] >= RENDER_AFTER_USES
+    if due:
+        render_async([text], voice, rate)
+
+def _render(jobs, voice, rate):
+    try:
+        process = subprocess.Popen([sys.executable, SPEAK_SCRIPT, "--render"],
+                                   stdin=subprocess.PIPE, text=True, encoding="utf-8")
+        for key, text, path in jobs:
+            process.stdin.write(json.dumps({"text": text, "path": path, "voice": voice, "rate": rate}) + "\n")
+        process.stdin.close()
+        process.wait()
+    except Exception as e:
+        print(f"Prompt Render Error: {e}")
+    finally:
+        with _lock:
+            for key, _, path in jobs:
+                _rendering.discard(key)
+                if os.path.exists(path):
+                    _ready[key] = path
+
+def render_async(texts, voice=None, rate=None):
+    """
+    Renders the given phrases to WAV in the background (skips ones already cached or in progress).
+    """
+    jobs = []
+    with _lock:
+        for text in texts:
+            if not text or len(text) > MAX_PROMPT_CHARS:
+                continue
+            key = prompt_key(text, voice, rate)
+            if key in _ready or key in _rendering:
+                continue
+            _rendering.add(key)
+            jobs.append((key, text.strip(), os.path.join(_cache_dir, key + ".wav")))
+    if jobs:
+        os.makedirs(_cache_dir, exist_ok=True)
+        threading.Thread(target=_render, args=(jobs, voice, rate), daemon=True).start()
+    return len(jobs)
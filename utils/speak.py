@@ -1,20 +1,188 @@
 import pyttsx3
 import sys
 import os
+import json
+import queue
+import threading
+
+DEFAULT_RATE = 145
 
 def speak(text):
     try:
         engine = pyttsx3.init()
-        engine.setProperty('rate', 145)
+        engine.setProperty('rate', DEFAULT_RATE)
         engine.say(text)
         engine.runAndWait()
     except Exception as e:
         print(f"Error in speech process: {e}")
 
+def render_files(jobs_in):
+    """
+    Render mode: reads {"text", "path", "voice", "rate"} JSON lines and saves each phrase to a WAV.
+    Files are written under a temporary name and moved into place, so readers never see a partial file.
+    """
+    engine = pyttsx3.init()
+    engine.setProperty('rate', DEFAULT_RATE)
+    done = []
+    for line in jobs_in:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        if job.get("voice"):
+            engine.setProperty('voice', job["voice"])
+        engine.setProperty('rate', job.get("rate") or DEFAULT_RATE)
+        tmp_path = job["path"] + ".part"
+        engine.save_to_file(job["text"], tmp_path)
+        engine.runAndWait()
+        done.append((tmp_path, job["path"]))
+    for tmp_path, path in done:
+        if os.path.exists(tmp_path) and os.path.getsize(tmp_path) > 0:
+            os.replace(tmp_path, path)
+
+class WavPlayer:
+    """
+    Plays pre-rendered WAV files on a background thread through PyAudio (already needed for the mic).
+    """
+
+    CHUNK = 1024
+
+    def __init__(self):
+        self._audio = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def play(self, path, on_done):
+        self.stop()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(path, self._stop, on_done), daemon=True)
+        self._thread.start()
+
+    def _run(self, path, stop, on_done):
+        completed, failed = False, False
+        try:
+            import pyaudio
+            import wave
+            if self._audio is None:
+                self._audio = pyaudio.PyAudio()
+            with wave.open(path, "rb") as wf:
+                stream = self._audio.open(format=self._audio.get_format_from_width(wf.getsampwidth()),
+                                          channels=wf.getnchannels(), rate=wf.getframerate(), output=True)
+                try:
+                    data = wf.readframes(self.CHUNK)
+                    while data and not stop.is_set():
+                        stream.write(data)
+                        data = wf.readframes(self.CHUNK)
+                    completed = not stop.is_set()
+                finally:
+                    stream.stop_stream()
+                    stream.close()
+        except Exception as e:
+            print(f"Error playing {path}: {e}", file=sys.stderr)
+            failed = True
+        on_done(completed, failed)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+def run_worker(commands_in, events_out):
+    """
+    Persistent mode: keeps one engine initialized and reads JSON commands, one per line:
+        {"cmd": "speak", "id": 7, "text": "..."}   queue an utterance
+        {"cmd": "play", "id": 8, "path": "x.wav", "text": "..."}  play a pre-rendered prompt
+                                                   (text is synthesized if the file can't be played)
+        {"cmd": "stop"}                             cut the current utterance and drop the queue
+        {"cmd": "rate", "value": 160}
+        {"cmd": "voice", "value": "<pyttsx3 voice id>"}
+        {"cmd": "quit"}
+    and writes JSON events, one per line: ready, started, word (location, length), finished (completed).
+    """
+    commands = queue.Queue()
+    out_lock = threading.Lock()
+
+    def emit(event, **fields):
+        fields["event"] = event
+        with out_lock:
+            events_out.write(json.dumps(fields) + "\n")
+            events_out.flush()
+
+    def read_commands():
+        for line in commands_in:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                commands.put(json.loads(line))
+            except ValueError:
+                print(f"Bad speech command: {line!r}", file=sys.stderr)
+        commands.put({"cmd": "quit"})  # Parent closed the pipe
+
+    threading.Thread(target=read_commands, daemon=True).start()
+
+    engine = pyttsx3.init()
+    engine.setProperty('rate', DEFAULT_RATE)
+    # Utterance names carry the command id back to the parent
+    engine.connect('started-utterance', lambda name: emit("started", id=int(name)))
+    engine.connect('started-word', lambda name, location, length:
+                   emit("word", id=int(name), location=location, length=length))
+    engine.connect('finished-utterance', lambda name, completed:
+                   emit("finished", id=int(name), completed=bool(completed)))
+
+    player = WavPlayer()
+
+    # External loop so commands (e.g. stop) are handled while an utterance is playing
+    engine.startLoop(False)
+    emit("ready")
+    try:
+        while True:
+            try:
+                cmd = commands.get(timeout=0.01)
+            except queue.Empty:
+                cmd = None
+            if cmd:
+                kind = cmd.get("cmd")
+                if kind == "quit":
+                    break
+                try:
+                    if kind == "speak":
+                        engine.say(cmd["text"], name=str(cmd["id"]))
+                    elif kind == "play":
+                        engine.stop()
+                        emit("started", id=cmd["id"])
+
+                        def played(completed, failed, cmd=cmd):
+                            if failed and cmd.get("text"):
+                                commands.put({"cmd": "speak", "id": cmd["id"], "text": cmd["text"]})
+                            else:
+                                emit("finished", id=cmd["id"], completed=completed)
+
+                        player.play(cmd["path"], played)
+                    elif kind == "stop":
+                        engine.stop()
+                        player.stop()
+                    elif kind == "rate":
+                        engine.setProperty('rate', int(cmd["value"]))
+                    elif kind == "voice":
+                        engine.setProperty('voice', cmd["value"])
+                except Exception as e:
+                    print(f"Error in speech worker: {e}", file=sys.stderr)
+            engine.iterate()
+    finally:
+        player.stop()
+        engine.endLoop()
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        sys.stdin.reconfigure(encoding="utf-8")
+        sys.stdout.reconfigure(encoding="utf-8")
+        run_worker(sys.stdin, sys.stdout)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--render":
+        sys.stdin.reconfigure(encoding="utf-8")
+        render_files(sys.stdin)
+    elif len(sys.argv) > 1:
         input_arg = " ".join(sys.argv[1:])
-        
+
         # Check if input is a file path
         if os.path.exists(input_arg) and os.path.isfile(input_arg):
             try:
@@ -25,5 +193,5 @@ if __name__ == "__main__":
                 text = "Error reading speech file."
         else:
             text = input_arg
-            
+
         speak(text)
@@ -0,0 +1,248 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Timing spans for the voice pipeline. A span nests under the one open on the same thread
+# (bind() carries that across to worker threads), so one voice turn becomes one trace:
+# turn > voice.listen, nlu.parse_command > gemini.generate, email.*, tts.speak, ...
+# Finished spans go to a JSON-lines file (configure) and into per-name latency histograms,
+# which serve_metrics() exposes in Prometheus text format on a local port.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+
+_local = threading.local()
+_lock = threading.Lock()
+_trace_file = None
+_histograms = {}   # span name -> [bucket counts..., +Inf count, sum]
+_errors = {}       # span name -> count
+_counters = []     # (metric name, label name, help, fn returning {label: value})
+_server = None
+
+class Span:
+    """
+    One timed operation. annotate() adds attributes; drop() discards it (e.g. nothing was heard).
+    """
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.error = None
+        self.dropped = False
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def annotate(self, **attrs):
+        self.attrs.update(attrs)
+
+    def drop(self):
+        self.dropped = True
+
+    def finish(self, duration=None):
+        if not self.dropped:
+            _export(self, time.perf_counter() - self._t0 if duration is None else duration)
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+def current():
+    """
+    The innermost open span on this thread, or None.
+    """
+    stack = _stack()
+    return stack[-1] if stack else None
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    Times the enclosed block: `with tracing.span("email.send", to=addr) as sp:`
+    """
+    sp = Span(name, current(), **attrs)
+    stack = _stack()
+    stack.append(sp)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if stack and stack[-1] is sp:
+            stack.pop()
+        sp.finish()
+
+def traced(name):
+    """
+    Decorator: runs every call of the function in a span called name.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def annotate(**attrs):
+    """
+    Adds attributes to the current span, if any.
+    """
+    sp = current()
+    if sp:
+        sp.annotate(**attrs)
+
+def bind(fn):
+    """
+    Wraps fn so spans it opens on another thread (pool, background fetch) join the caller's trace.
+    """
+    parent = current()
+    if parent is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stack = _stack()
+        stack.append(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if stack and stack[-1] is parent:
+                stack.pop()
+    return wrapper
+
+def record(name, duration, parent=None, **attrs):
+    """
+    Records a span measured elsewhere (e.g. from an event), ending now.
+    """
+    sp = Span(name, parent, **attrs)
+    sp.start = time.time() - duration
+    sp.finish(duration)
+
+def _export(sp, duration):
+    with _lock:
+        hist = _histograms.get(sp.name)
+        if hist is None:
+            hist = _histograms[sp.name] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                hist[i] += 1
+        hist[len(BUCKETS)] += 1
+        hist[len(BUCKETS) + 1] += duration
+        if sp.error:
+            _errors[sp.name] = _errors.get(sp.name, 0) + 1
+        f = _trace_file
+    if f is None:
+        return
+    line = {"trace": sp.trace_id, "span": sp.span_id, "parent": sp.parent_id, "name": sp.name,
+            "start": round(sp.start, 6), "duration_ms": round(duration * 1000, 3),
+            "thread": threading.current_thread().name}
+    if sp.error:
+        line["error"] = sp.error
+    if sp.attrs:
+        line["attrs"] = sp.attrs
+    try:
+        with _lock:
+            f.write(json.dumps(line, default=str) + "\n")
+    except (OSError, ValueError) as e:
+        print(f"Trace Write Error: {e}")
+
+def configure(trace_path=None):
+    """
+    Appends finished spans to trace_path as JSON lines (None: histograms only).
+    """
+    global _trace_file
+    with _lock:
+        if _trace_file:
+            _trace_file.close()
+        _trace_file = None
+        if trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            _trace_file = open(trace_path, "a", encoding="utf-8", buffering=1)
+
+def add_counter(metric, label, fn, help_text=""):
+    """
+    Exposes fn() -> {label value: count} as a Prometheus counter (read at scrape time).
+    """
+    with _lock:
+        _counters.append((metric, label, help_text, fn))
+
+def get_histograms():
+    """
+    {span name: {"count", "sum", "buckets": {le: cumulative count}}}.
+    """
+    with _lock:
+        items = {name: list(h) for name, h in _histograms.items()}
+    return {name: {"count": h[len(BUCKETS)], "sum": h[len(BUCKETS) + 1],
+                   "buckets": dict(zip(BUCKETS, h[:len(BUCKETS)]))} for name, h in items.items()}
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+def render_metrics():
+    """
+    Current histograms and counters in Prometheus text exposition format.
+    """
+    out = ["# HELP swar_span_duration_seconds Duration of traced operations.",
+           "# TYPE swar_span_duration_seconds histogram"]
+    for name, h in sorted(get_histograms().items()):
+        for bound, count in h["buckets"].items():
+            out.append(f'swar_span_duration_seconds_bucket{{span="{_label(name)}",le="{bound}"}} {count}')
+        out.append(f'swar_span_duration_seconds_bucket{{span="{_label(name)}",le="+Inf"}} {h["count"]}')
+        out.append(f'swar_span_duration_seconds_sum{{span="{_label(name)}"}} {h["sum"]:.6f}')
+        out.append(f'swar_span_duration_seconds_count{{span="{_label(name)}"}} {h["count"]}')
+    with _lock:
+        errors = dict(_errors)
+        counters = list(_counters)
+    out += ["# HELP swar_span_errors_total Traced operations that raised.",
+            "# TYPE swar_span_errors_total counter"]
+    for name, count in sorted(errors.items()):
+        out.append(f'swar_span_errors_total{{span="{_label(name)}"}} {count}')
+    for metric, label, help_text, fn in counters:
+        try:
+            values = fn()
+        except Exception as e:
+            print(f"Metrics Counter Error ({metric}): {e}")
+            continue
+        out += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for key, value in sorted(values.items()):
+            out.append(f'{metric}{{{label}="{_label(key)}"}} {value}')
+    return "\n".join(out) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the console
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Serves /metrics on host:port from a daemon thread (once per process). Returns False if the port is taken.
+    """
+    global _server
+    if _server:
+        return True
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Metrics Server Error: {e}")
+        return False
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics: http://{host}:{port}/metrics")
+    return True
@@ -4,71 +4,710 @@ import time
 import subprocess
 import sys
 import os
+import json
+import queue
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from utils import prompt_audio, asr, mic_calibration, tracing
+from utils.keyword_spotter import KeywordSpotter
 
-# Subprocess-based TTS to avoid blocking main thread or COM issues
-_current_process = None
+# TTS runs in one long-lived subprocess (speak.py --worker) to avoid blocking the main thread
+# or COM issues; the engine stays initialized between utterances.
+SPEAK_SCRIPT = os.path.join(os.path.dirname(__file__), "speak.py")
+
+class TTSWorker:
+    """
+    Client for the persistent speech process. Commands go over its stdin as JSON lines;
+    a reader thread consumes its started/word/finished events to track what is still playing.
+    The process is (re)started on demand.
+    """
+
+    def __init__(self):
+        self.process = None
+        self._next_id = 0
+        self._pending = set()  # Utterance ids queued or playing
+        self._sent = {}        # Utterance id -> (hand-off time, span) until it starts playing
+        self._cond = threading.Condition()
+        self._listeners = []
+        self.rate = None   # None = engine default; part of the prompt audio cache key
+        self.voice = None  # pyttsx3 voice id, None = engine default; also part of the key
+        self.last_finished = 0.0  # When speech last ended; the mic ignores its echo (MicCapture)
+
+    def _ensure_started(self):
+        if self.process and self.process.poll() is None:
+            return
+        self.process = subprocess.Popen([sys.executable, SPEAK_SCRIPT, "--worker"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        text=True, encoding="utf-8", bufsize=1)
+        self._pending.clear()
+        self._sent.clear()
+        threading.Thread(target=self._read_events, args=(self.process,), daemon=True).start()
+        # A restarted engine must sound like the cached prompts it is keyed against
+        if self.rate:
+            self._send(cmd="rate", value=self.rate)
+        if self.voice:
+            self._send(cmd="voice", value=self.voice)
+
+    def _send(self, **command):
+        self.process.stdin.write(json.dumps(command) + "\n")
+        self.process.stdin.flush()
+
+    def _read_events(self, process):
+        for line in process.stdout:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                print(line.rstrip())
+                continue
+            with self._cond:
+                sent = self._sent.pop(event.get("id"), None) if event.get("event") in ("started", "finished") else None
+                if event.get("event") == "finished":
+                    self._pending.discard(event.get("id"))
+                    self.last_finished = time.time()
+                    self._cond.notify_all()
+                listeners = list(self._listeners)
+            if sent and event.get("event") == "started":
+                tracing.record("tts.first_audio", time.perf_counter() - sent[0], parent=sent[1])
+            for callback in listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Speech Event Listener Error: {e}")
+        # Process exited: nothing it had queued will play
+        with self._cond:
+            if process is self.process:
+                self._pending.clear()
+            self._cond.notify_all()
+
+    def start(self):
+        with self._cond:
+            self._ensure_started()
+
+    def subscribe(self, callback):
+        """
+        Calls callback(event) for every worker event; returns a function that unsubscribes.
+        """
+        with self._cond:
+            self._listeners.append(callback)
+
+        def unsubscribe():
+            with self._cond:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        return unsubscribe
+
+    def speak(self, text, interrupt=True):
+        """
+        Queues text (after cutting off current speech if interrupt). Returns the utterance id.
+        """
+        with self._cond:
+            self._ensure_started()
+            if interrupt and self._pending:
+                self._pending.clear()
+                self._send(cmd="stop")
+            self._next_id += 1
+            self._pending.add(self._next_id)
+            self._sent[self._next_id] = (time.perf_counter(), tracing.current())
+            self._send(cmd="speak", id=self._next_id, text=text)
+            return self._next_id
+
+    def play(self, path, text=None):
+        """
+        Plays a pre-rendered WAV, cutting off current speech. Returns the utterance id.
+        """
+        with self._cond:
+            self._ensure_started()
+            if self._pending:
+                self._pending.clear()
+                self._send(cmd="stop")
+            self._next_id += 1
+            self._pending.add(self._next_id)
+            self._sent[self._next_id] = (time.perf_counter(), tracing.current())
+            self._send(cmd="play", id=self._next_id, path=path, text=text)
+            return self._next_id
+
+    def stop(self):
+        with self._cond:
+            if self.process and self.process.poll() is None:
+                self._pending.clear()
+                self._send(cmd="stop")
+                self.last_finished = time.time()
+            self._cond.notify_all()
+
+    def set_rate(self, rate):
+        with self._cond:
+            self._ensure_started()
+            self._send(cmd="rate", value=rate)
+            self.rate = rate
+
+    def set_voice(self, voice):
+        with self._cond:
+            self._ensure_started()
+            self._send(cmd="voice", value=voice)
+            self.voice = voice
+
+    def is_speaking(self):
+        with self._cond:
+            return bool(self._pending) and self.process is not None and self.process.poll() is None
+
+    def wait(self, timeout=None):
+        """
+        Blocks until everything queued has been spoken. Returns False on timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout=timeout)
+
+    def close(self):
+        with self._cond:
+            if self.process and self.process.poll() is None:
+                try:
+                    self._send(cmd="quit")
+                    self.process.stdin.close()
+                except (BrokenPipeError, OSError):
+                    self.process.terminate()
+            self.process = None
+            self._pending.clear()
+            self._cond.notify_all()
+
+# Each assistant session (e.g. a browser tab) gets its own speech process, so two sessions on
+# one host never cut off or wait on each other's speech. Calls without a session use the default.
+SESSION_IDLE_TIMEOUT = 1800  # seconds; idle session speech processes are shut down
+
+_worker_factory = TTSWorker
+_default_worker = TTSWorker()
+_session_workers = {}  # session id -> [TTSWorker, last used]
+_sessions_lock = threading.Lock()
+_session = threading.local()
+
+def use_session(session_id):
+    """
+    Routes speech calls made on this thread to the given session's speech process.
+    """
+    _session.id = session_id
+
+def _current_worker():
+    session_id = getattr(_session, "id", None)
+    if session_id is None:
+        return _default_worker
+    now = time.time()
+    with _sessions_lock:
+        entry = _session_workers.get(session_id)
+        if entry is None:
+            entry = _session_workers[session_id] = [_worker_factory(), now]
+        entry[1] = now
+        idle = [sid for sid, (_, used) in _session_workers.items() if now - used > SESSION_IDLE_TIMEOUT]
+        idle_workers = [_session_workers.pop(sid)[0] for sid in idle]
+    for worker in idle_workers:
+        worker.close()
+    return entry[0]
+
+def end_session(session_id):
+    """
+    Shuts down the session's speech process.
+    """
+    with _sessions_lock:
+        entry = _session_workers.pop(session_id, None)
+    if entry:
+        entry[0].close()
+
+def set_worker_factory(factory):
+    """
+    Replaces the speech process with factory() objects (same interface as TTSWorker), e.g. a
+    silent stand-in for replay runs. Existing workers are shut down.
+    """
+    global _worker_factory, _default_worker
+    with _sessions_lock:
+        old = [_default_worker] + [worker for worker, _ in _session_workers.values()]
+        _session_workers.clear()
+        _worker_factory = factory
+        _default_worker = factory()
+    for worker in old:
+        worker.close()
+
+def start_tts_worker():
+    """
+    Starts the speech process ahead of time so the first utterance doesn't pay for engine startup.
+    """
+    try:
+        _current_worker().start()
+    except Exception as e:
+        print(f"Speech Worker Error: {e}")
 
 def speak(text):
     """
-    Spawns a separate process to speak the text. Non-blocking.
+    Speaks text in the background speech process, cutting off anything still playing. Non-blocking.
+    Phrases with a pre-rendered WAV (see utils/prompt_audio.py) are played directly instead.
+    Returns the utterance id (matches the "id" of its events), or None if nothing was started.
     """
-    global _current_process
-    if not text: return
-    
-    # Stop previous if any
-    stop_speaking()
-    
+    if not text: return None
     try:
-        # We use Popen so it runs in background and doesn't block
-        script_path = os.path.join(os.path.dirname(__file__), "speak.py")
-        
-        # Write text to a temp file to avoid command line length limits
-        # Use a fixed temp file name so we don't spam files
-        temp_file = os.path.join(os.path.dirname(__file__), "temp_speech.txt")
+        with tracing.span("tts.speak", chars=len(text)) as sp:
+            worker = _current_worker()
+            cached = prompt_audio.lookup(text, voice=worker.voice, rate=worker.rate)
+            sp.annotate(cached=bool(cached))
+            if cached:
+                print(f"Assistant Speaking (Cached): {text[:60]}")
+                return worker.play(cached, text)
+            print(f"Assistant Speaking: {text[:60]}")
+            utterance = worker.speak(text)
+            prompt_audio.note_spoken(text, voice=worker.voice, rate=worker.rate)
+            return utterance
+    except Exception as e:
+        print(f"Speech Worker Error: {e}")
+        return None
+
+def subscribe(callback):
+    """
+    Registers callback(event) for playback progress, relayed from the speech process:
+        {"event": "started", "id": 3}
+        {"event": "word", "id": 3, "location": 12, "length": 5}   (character offsets into the text)
+        {"event": "finished", "id": 3, "completed": True}         (completed=False when cut off)
+    Callbacks run on the event reader thread. Returns a function that unsubscribes.
+    """
+    return _current_worker().subscribe(callback)
+
+def prerender_prompts(texts, cache_dir=prompt_audio.CACHE_DIR):
+    """
+    Renders fixed assistant phrases to WAV in the background so they play without synthesis.
+    """
+    try:
+        prompt_audio.configure(cache_dir)
+        prompt_audio.render_async(texts)
+    except Exception as e:
+        print(f"Prompt Audio Error: {e}")
+
+def set_speech_rate(rate):
+    try:
+        _current_worker().set_rate(rate)
+    except Exception as e:
+        print(f"Speech Worker Error: {e}")
+
+def set_speech_voice(voice):
+    """
+    Switches the session's TTS voice (a pyttsx3 voice id). Cached prompts are per voice.
+    """
+    try:
+        _current_worker().set_voice(voice)
+    except Exception as e:
+        print(f"Speech Worker Error: {e}")
+
+class SpeechStream:
+    """
+    Incremental speech: each say() is queued behind the previous sentence and spoken
+    as soon as it finishes. close() lets the queue drain.
+    """
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def say(self, text):
+        if not text: return False
         try:
-             with open(temp_file, "w", encoding="utf-8") as f:
-                 f.write(text)
-        except Exception as e:
-             print(f"Error writing temp speech file: {e}")
-             return
+            self.worker.speak(text.replace("\n", " "), interrupt=False)
+            return True
+        except (BrokenPipeError, OSError, ValueError):
+            return False
+
+    def close(self):
+        pass  # Queued sentences keep playing; stop_speaking() cuts them off
 
-        print(f"Assistant Speaking (Subprocess): [Content of {temp_file}]")
-        _current_process = subprocess.Popen([sys.executable, script_path, temp_file])
+def open_speech_stream():
+    """
+    Stops any current speech and returns a SpeechStream for incremental text.
+    stop_speaking() / is_speaking() apply to it like to speak().
+    """
+    stop_speaking()
+    worker = _current_worker()
+    try:
+        worker.start()
     except Exception as e:
-        print(f"Speech Subprocess Error: {e}")
+        print(f"Speech Worker Error: {e}")
+        return None
+    print("Assistant Speaking (Stream)")
+    return SpeechStream(worker)
 
 def stop_speaking():
     """
-    Terminates the current speech process immediately.
+    Cuts off current speech immediately (the speech process stays up).
+    """
+    try:
+        _current_worker().stop()
+    except Exception as e:
+        print(f"Error stopping speech: {e}")
+
+def is_speaking():
+    """
+    Returns True while anything queued is still being spoken.
+    """
+    return _current_worker().is_speaking()
+
+def wait_until_done(timeout=None):
+    """
+    Blocks until current speech has finished (or timeout). Returns False on timeout.
     """
-    global _current_process
-    if _current_process:
-        print("DEBUG: Terminating speech process...")
+    return _current_worker().wait(timeout)
+
+# --- Microphone ---
+# The mic stays open on a background thread: speech_recognition's listen_in_background cuts
+# phrases with its energy-based voice activity detection, each phrase is sent to a small
+# recognition pool right away, and listen() just takes the next result off the queue.
+# Nothing said between two listen() calls is lost and the device is opened only once.
+# Phrases that overlap the assistant's own speech are marked as such: with speakers next to the
+# mic they are mostly its echo, so listen() takes them only as loud barge-ins (energy_threshold).
+# There is one capture per process and every session reads from the same queue, so only one
+# session should be listening at a time (the app pauses sessions whose page isn't open;
+# swar_daemon.py runs one assistant per process).
+
+PHRASE_TIME_LIMIT = 8        # seconds; longest single utterance
+MAX_UTTERANCE_AGE = 15.0     # seconds; older queued utterances are considered stale
+RECOGNITION_TIMEOUT = 10.0   # seconds to wait for a queued utterance to be transcribed
+ECHO_TAIL = 0.3              # seconds after speech ends that the room still echoes it
+LEVEL_CHUNK = 1024           # samples per block when measuring an utterance's loudness
+
+def _audio_level(samples):
+    """
+    Peak RMS over LEVEL_CHUNK blocks, comparable to Recognizer.energy_threshold.
+    """
+    samples = samples.astype(np.float32)
+    if samples.size == 0:
+        return 0.0
+    blocks = samples[:samples.size - samples.size % LEVEL_CHUNK].reshape(-1, LEVEL_CHUNK) \
+        if samples.size >= LEVEL_CHUNK else samples.reshape(1, -1)
+    return float(np.sqrt((blocks ** 2).mean(axis=1)).max())
+
+class MicCapture:
+    """
+    Continuous capture: queues (captured_at, level, during_speech, Future[text], partials) in the
+    order phrases were spoken.
+    With a KeywordSpotter, short phrases are first checked offline for "stop"/"cancel"; while
+    someone is subscribed via on_keyword() a hit goes straight to them without any network call.
+    Otherwise every phrase, hit or not, is transcribed as usual.
+    """
+
+    def __init__(self, workers=2, spotter=None, device_index=None, calibration=None):
+        self.recognizer = sr.Recognizer()
+        self.device_index = device_index
+        self.calibration = calibration or mic_calibration.Calibration(mic_calibration.device_name(device_index))
+        self.recognizer.pause_threshold = 0.5
+        self.recognizer.non_speaking_duration = 0.4
+        self.utterances = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asr")
+        self._stop = None
+        self.spotter = spotter
+        self._keyword_listeners = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        source = sr.Microphone(device_index=self.device_index)
+        # A stored calibration skips the measurement; dynamic adjustment refines it from there
+        if self.calibration.load():
+            self.calibration.apply(self.recognizer)
+        else:
+            with source as s:
+                self.calibration.measure(self.recognizer, s)
+        self._stop = self.recognizer.listen_in_background(source, self._on_phrase,
+                                                          phrase_time_limit=PHRASE_TIME_LIMIT)
+
+    def running(self):
+        return self._stop is not None
+
+    def stop(self):
+        if self._stop:
+            self._stop(wait_for_stop=False)
+            self._stop = None
+
+    def on_keyword(self, callback):
+        """
+        Calls callback(keyword) when a keyword is spotted; returns a function that unsubscribes.
+        """
+        with self._lock:
+            self._keyword_listeners.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._keyword_listeners:
+                    self._keyword_listeners.remove(callback)
+        return unsubscribe
+
+    def _on_phrase(self, recognizer, audio):
+        captured_at = time.time()
+        self.calibration.update(recognizer.energy_threshold)
+        samples = np.frombuffer(audio.get_raw_data(convert_width=2), dtype=np.int16)
+        level = _audio_level(samples)
+        during_speech = _speech_since(captured_at - samples.size / audio.sample_rate)
+
+        keyword = self.spotter.detect(samples, audio.sample_rate) if self.spotter else None
+        if keyword:
+            print(f"Keyword spotted: {keyword}")
+            with self._lock:
+                listeners = list(self._keyword_listeners)
+            for callback in listeners:
+                try:
+                    callback(keyword)
+                except Exception as e:
+                    print(f"Keyword Listener Error: {e}")
+            if listeners:
+                return  # Consumed as a barge-in
+            # Nobody is waiting to barge in: a misdetected short answer must still be transcribed
+
+        partials = queue.Queue()
+        future = self._pool.submit(self._recognize, audio, samples, partials)
+        self.utterances.put((captured_at, level, during_speech, future, partials))
+
+    def _recognize(self, audio, samples, partials):
         try:
-            _current_process.terminate()
-            _current_process = None
+            text = _transcribe(audio, on_partial=partials.put)
         except Exception as e:
-            print(f"Error terminating process: {e}")
+            print(f"Recognition Error ({_asr.name}): {e}")
+            return None
+        if not text:
+            return None
+        print(f"User said: {text}")
+        if self.spotter and text.strip() in self.spotter.keywords:
+            # The spotter missed this one: learn it as a new example of the user's voice
+            self.spotter.add_template(text.strip(), samples, audio.sample_rate)
+        return text
 
-def is_speaking():
+    def discard(self, before=None):
+        """
+        Drops queued utterances captured before the given time (default: now).
+        """
+        before = time.time() if before is None else before
+        kept = []
+        while True:
+            try:
+                entry = self.utterances.get_nowait()
+            except queue.Empty:
+                break
+            if entry[0] >= before:
+                kept.append(entry)
+        for entry in kept:
+            self.utterances.put(entry)
+
+    def read(self, timeout, min_level=None, on_partial=None):
+        """
+        Next recognized utterance that starts within timeout seconds, or None.
+        Stale entries and ones quieter than min_level are skipped, as are ones heard while the
+        assistant was speaking unless min_level is given (barge-in). on_partial(text) is called
+        on the caller's thread with partial transcripts while the utterance is being decoded.
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                captured_at, level, during_speech, future, partials = self.utterances.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if time.time() - captured_at > MAX_UTTERANCE_AGE:
+                continue
+            if during_speech and not min_level:
+                continue  # Most likely the assistant's own voice
+            if min_level and level < min_level:
+                continue
+            text = _await_transcript(future, partials, on_partial)
+            if text:
+                return text
+
+def _speech_since(start):
+    """
+    True if any session's speech was playing at some point after start (or is still playing).
+    """
+    with _sessions_lock:
+        workers = [_default_worker] + [worker for worker, _ in _session_workers.values()]
+    return any(w.is_speaking() or w.last_finished + ECHO_TAIL > start for w in workers)
+
+def _await_transcript(future, partials, on_partial):
+    """
+    Waits up to RECOGNITION_TIMEOUT for future, relaying queued partial transcripts meanwhile.
+    """
+    deadline = time.time() + RECOGNITION_TIMEOUT
+    while True:
+        try:
+            return future.result(timeout=0.05 if on_partial else max(0.0, deadline - time.time()))
+        except FutureTimeout:
+            if time.time() >= deadline:
+                return None
+        while True:
+            try:
+                partial = partials.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                on_partial(partial)
+            except Exception as e:
+                print(f"Partial Transcript Error: {e}")
+
+_capture = None
+_asr = asr.GoogleBackend()
+_calibration = mic_calibration.Calibration()  # Used by per-call listening; capture brings its own
+
+def _transcribe(audio, on_partial=None):
+    with tracing.span("asr.transcribe", backend=_asr.name) as sp:
+        text = _asr.transcribe(audio, on_partial=on_partial)
+        sp.annotate(heard=bool(text))
+        return text
+
+def configure_asr(backend="google", **options):
+    """
+    Selects the speech-to-text backend (see utils/asr.py). Falls back to Google if the
+    requested engine can't be loaded. Returns the name of the backend in use.
+    """
+    global _asr
+    try:
+        _asr = asr.create_backend(backend, **options)
+    except Exception as e:
+        print(f"ASR Backend Error ({backend}): {e}. Using Google.")
+        _asr = asr.GoogleBackend()
+    print(f"ASR Backend: {_asr.name}")
+    return _asr.name
+
+def use_asr_backend(backend):
     """
-    Returns True if the assistant is currently speaking (subprocess active).
+    Uses an already built backend object (anything with transcribe(audio, on_partial)).
     """
-    global _current_process
-    if _current_process and _current_process.poll() is None:
+    global _asr
+    _asr = backend
+
+def start_background_listening(keyword_spotting=True, device_index=None):
+    """
+    Opens the microphone once and keeps capturing. Without it, listen() opens the mic per call.
+    keyword_spotting enables offline "stop"/"cancel" detection (see utils/keyword_spotter.py).
+    """
+    global _capture, _calibration
+    if _capture and _capture.running():
+        return True
+    try:
+        capture = MicCapture(spotter=KeywordSpotter() if keyword_spotting else None,
+                             device_index=device_index)
+        capture.start()
+        _capture = capture
+        _calibration = capture.calibration
         return True
-    return False
+    except Exception as e:
+        print(f"Microphone Capture Error: {e}")
+        return False
+
+def keyword_spotting_ready():
+    """
+    True when "stop"/"cancel" can be detected offline (capture running and examples learned).
+    """
+    return bool(_capture and _capture.running() and _capture.spotter and _capture.spotter.available())
+
+def on_keyword(callback):
+    """
+    Calls callback(keyword) from the capture thread when "stop"/"cancel" is spotted offline.
+    Returns a function that unsubscribes. Spotted keywords are not queued for listen() meanwhile.
+    """
+    if not _capture:
+        return lambda: None
+    return _capture.on_keyword(callback)
+
+def barge_in_threshold():
+    """
+    Loudness an utterance needs to count while the assistant is speaking, from the calibration.
+    """
+    return _calibration.barge_in_threshold()
+
+def discard_heard(before=None):
+    """
+    Forgets utterances the background capture heard before the given time (default: now),
+    e.g. whatever was picked up while a prompt played, before asking for a PIN.
+    """
+    if _capture:
+        _capture.discard(before)
+
+def stop_background_listening():
+    global _capture
+    if _capture:
+        _capture.stop()
+        _capture = None
+
+# --- Replay ---
+# For end-to-end timing runs (replay_session.py): listen() takes recorded WAV files in order
+# instead of the microphone. They still go through the configured ASR backend.
+
+class ReplaySource:
+    """
+    Queue of recorded utterances. last holds the timings of the most recent one.
+    """
+
+    def __init__(self, wav_paths):
+        self._paths = queue.Queue()
+        for path in wav_paths:
+            self._paths.put(path)
+        self.last = None
+
+    def remaining(self):
+        return self._paths.qsize()
+
+    def read(self, timeout=0, on_partial=None):
+        try:
+            path = self._paths.get_nowait()
+        except queue.Empty:
+            time.sleep(timeout)  # Nothing more was said
+            return None
+        started = time.perf_counter()
+        with sr.AudioFile(path) as source:
+            audio = sr.Recognizer().record(source)
+        loaded = time.perf_counter()
+        text = _transcribe(audio, on_partial=on_partial)
+        self.last = {
+            "wav": path,
+            "audio_seconds": len(audio.frame_data) / float(audio.sample_rate * audio.sample_width),
+            "capture": loaded - started,
+            "asr": time.perf_counter() - loaded,
+            "transcript": text,
+        }
+        print(f"User said (replay): {text}")
+        return text
+
+_replay = None
+
+def start_replay(wav_paths):
+    """
+    Makes listen() return the transcripts of the given WAV files, one per call. Returns the ReplaySource.
+    """
+    global _replay
+    _replay = ReplaySource(wav_paths)
+    return _replay
+
+def stop_replay():
+    global _replay
+    _replay = None
+
+def listen(timeout=5, phrase_time_limit=5, adjust_noise=True, energy_threshold=None, on_partial=None):
+    """
+    Returns the next thing the user said (lower-cased), or None if nothing within timeout seconds.
+    With background capture running this is a queue read; energy_threshold then filters out
+    quieter utterances, and phrase_time_limit / adjust_noise are fixed by the capture thread.
+    on_partial(text) receives partial transcripts (offline backends only) on this thread.
+    """
+    with tracing.span("voice.listen") as sp:
+        if _replay:
+            source, text = "replay", _replay.read(timeout, on_partial=on_partial)
+        elif _capture and _capture.running():
+            source, text = "capture", _capture.read(timeout, min_level=energy_threshold, on_partial=on_partial)
+        else:
+            source, text = "mic", _listen_once(timeout, phrase_time_limit, adjust_noise, energy_threshold, on_partial)
+        if not text:
+            sp.drop()  # Silence is not a turn
+        sp.annotate(source=source, backend=_asr.name)
+        return text
 
-def listen(timeout=5, phrase_time_limit=5, adjust_noise=True, energy_threshold=None):
+def _listen_once(timeout=5, phrase_time_limit=5, adjust_noise=True, energy_threshold=None, on_partial=None):
     r = sr.Recognizer()
+    if _calibration.energy_threshold is None:
+        _calibration.load()
+    _calibration.apply(r)
     if energy_threshold:
         r.energy_threshold = energy_threshold
     with sr.Microphone() as source:
         print("Listening...")
-        # Fast adjust
-        # Fast adjust - reduced to 0.1s to speed up response loop
-        if adjust_noise:
-            r.adjust_for_ambient_noise(source, duration=0.1)
+        # Calibrate only once; afterwards every call reuses (and keeps adapting) the stored level
+        if adjust_noise and _calibration.energy_threshold is None:
+            _calibration.measure(r, source, duration=0.1)
         
         # Optimization: Stop listening sooner after silence
         r.pause_threshold = 0.5  # Default is 0.8
@@ -78,9 +717,11 @@ def listen(timeout=5, phrase_time_limit=5, adjust_noise=True, energy_threshold=N
             # Ideally we pause recognized audio if it matches outgoing TTS? Too complex.
             # We rely on user saying "STOP" loud enough or during pause.
             audio = r.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+            if not energy_threshold:
+                _calibration.update(r.energy_threshold)
             print("Recognizing...")
-            text = r.recognize_google(audio)
+            text = _transcribe(audio, on_partial=on_partial)
             print(f"User said: {text}")
-            return text.lower()
+            return text
         except Exception:
             return None
@@ -0,0 +1,265 @@
+import queue
+import threading
+import time
+from utils import voice, nlu, dialogue, email_manager, tracing
+from utils.chat_log import ChatLog
+
+# Background voice loop of one assistant session. The worker thread listens, parses and
+# dispatches commands (spoken ones and UI clicks arrive through the same queue) and owns the
+# dialogue state. Front ends only read it: `version` changes whenever the dialogue state did,
+# chat.revision whenever the chat log did, so a page re-renders only when there is something new.
+
+LISTEN_SLICE = 1.0    # seconds per listen() call; queued UI commands wait at most this long
+UI_TIMEOUT = 10.0     # seconds without a heartbeat before the worker stops listening (tab closed)
+REPLY_WAIT = 10.0     # seconds to wait for a reply to finish before listening anyway (safety net)
+
+class VoiceWorker:
+    """
+    Runs the voice dialogue of one session on its own thread.
+    heartbeat_timeout=None keeps it listening without a front end calling heartbeat().
+    """
+
+    def __init__(self, session_id, user, chat=None, mail=email_manager, heartbeat_timeout=UI_TIMEOUT):
+        self.session_id = session_id
+        self.state = dialogue.DialogueState(user)
+        self.chat = chat if chat is not None else ChatLog()
+        self.commands = queue.Queue()   # (text, intent_data); None only wakes the loop
+        self.lock = threading.RLock()   # Held while the dialogue state changes
+        self.version = 0
+        self.status = "starting"
+        self.heartbeat_timeout = heartbeat_timeout
+        self.dialogue = dialogue.Dialogue(self.state, self.say, stream_summary=self.stream_summary, mail=mail)
+        self._last_seen = time.time()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.running():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f"voice-{self.session_id[:8]}", daemon=True)
+        self._thread.start()
+
+    def running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def stop(self):
+        self._stopping.set()
+        self.commands.put(None)
+
+    def heartbeat(self):
+        """
+        Called by the front end while it is displayed; the worker only listens while it is.
+        """
+        self._last_seen = time.time()
+
+    def submit(self, intent, text="", **params):
+        """
+        Queues a command from the UI (same intents as voice, e.g. submit("navigation", folder_name="Sent")).
+        """
+        self.commands.put((text, {"intent": intent, "params": params}))
+
+    # --- chat log / speech ---
+
+    def log(self, sender, message):
+        self.chat.add(sender, message)
+
+    def say(self, text, wait=False):
+        self.log("Swar", text)
+        voice.speak(text)
+        if wait:
+            # Block until the speech worker reports the utterance finished (timeout is only a safety net)
+            voice.wait_until_done(timeout=5.0 + len(text) * 0.1)
+
+    def stream_summary(self, body):
+        """
+        Speaks an email summary sentence by sentence while Gemini is still generating it.
+        """
+        self.log("Swar", "")
+        stream = voice.open_speech_stream()
+        shown = ""
+        for sentence in nlu.stream_email_summary(body):
+            if stream:
+                stream.say(sentence)
+            shown = (shown + " " + sentence).strip()
+            self.chat.update_last(shown)
+        if stream:
+            stream.close() # Finishes the queued sentences in the background
+        else:
+            voice.speak(shown)
+
+    def read_aloud(self, text):
+        """
+        Speaks text with a typewriter effect in the chat log, listening for "stop"/"cancel" meanwhile.
+        Returns True if it was interrupted.
+        """
+        self.log("Swar", "")
+        # Progress comes from the speech worker's word/finished events, so the subscription
+        # has to exist before the utterance starts
+        events = queue.Queue()
+        unsubscribe = voice.subscribe(events.put)
+        # Offline "stop"/"cancel" detection, when the keyword spotter has examples to match against
+        spotting = voice.keyword_spotting_ready()
+        unsubscribe_keywords = voice.on_keyword(lambda kw: events.put({"event": "keyword", "keyword": kw}))
+        utterance = voice.speak(text)
+        spoken = 0 # characters actually spoken so far
+        finished = utterance is None
+        self._set_status("speaking")
+
+        try:
+            while not finished and not self._stopping.is_set():
+                interrupt = None
+                # With keyword spotting the loop just waits on events; otherwise listen() below paces it
+                wait = 0.1 if spotting else 0
+                while True:
+                    try:
+                        event = events.get(timeout=wait) if wait else events.get_nowait()
+                    except queue.Empty:
+                        break
+                    wait = 0
+                    if event["event"] == "keyword":
+                        interrupt = event["keyword"]
+                    elif event.get("id") != utterance:
+                        continue
+                    elif event["event"] == "word":
+                        spoken = max(spoken, event["location"] + event["length"])
+                    elif event["event"] == "finished":
+                        finished = True
+                if interrupt is None and (finished or not voice.is_speaking()):
+                    break
+
+                num_chars = min(spoken, len(text))
+                self.chat.update_last(text[:num_chars] + (" ▌" if num_chars < len(text) else ""))
+
+                if interrupt is None and not spotting:
+                    # Only speech well above the calibrated room level counts while the assistant is talking
+                    cmd = voice.listen(timeout=0.5, phrase_time_limit=1.5, adjust_noise=False,
+                                       energy_threshold=voice.barge_in_threshold())
+                    if cmd and ("stop" in cmd.lower() or "cancel" in cmd.lower()):
+                        interrupt = cmd
+
+                if interrupt:
+                    self.chat.update_last(text[:spoken] + "...")
+                    self.log("User", interrupt)
+                    voice.stop_speaking()
+                    self.say("Stopped reading.")
+                    return True
+        finally:
+            unsubscribe()
+            unsubscribe_keywords()
+
+        self.chat.update_last(text)
+        return False
+
+    # --- loop ---
+
+    def _set_status(self, status):
+        self.status = status
+
+    def _changed(self):
+        with self.lock:
+            self.version += 1
+
+    def _run(self):
+        voice.use_session(self.session_id)
+        self._refresh()
+        while not self._stopping.is_set() and self.state.logged_in:
+            # One trace per turn: listening, parsing, acting, reading aloud and the refresh
+            with tracing.span("turn", session=self.session_id) as turn:
+                item = self._next_command()
+                if item is None:
+                    turn.drop()
+                    continue
+                text, intent_data = item
+                turn.annotate(intent=(intent_data or {}).get("intent"))
+                self._set_status("working")
+                with self.lock:
+                    self.dialogue.handle(text, intent_data)
+                self._changed()
+                if self.state.auto_read and self.state.selected_email is not None:
+                    self._read_selected()
+                self._refresh()
+        self._set_status("stopped")
+        self._changed()
+
+    def _next_command(self):
+        """
+        Next queued UI command, else the next thing the user says (parsed). None if there was neither.
+        """
+        try:
+            return self.commands.get_nowait()
+        except queue.Empty:
+            pass
+        if self.heartbeat_timeout and time.time() - self._last_seen > self.heartbeat_timeout:
+            # Nobody is looking at this session; leave the microphone to the others
+            self._set_status("paused")
+            try:
+                return self.commands.get(timeout=LISTEN_SLICE)
+            except queue.Empty:
+                return None
+
+        # Open the mic the moment the previous prompt finishes playing; until then only "stop"/"cancel" count
+        if voice.is_speaking():
+            self._set_status("speaking")
+            interrupt = self._wait_for_reply()
+            if interrupt:
+                self.log("User", interrupt)
+                return interrupt, self.dialogue.parse(interrupt)
+        with self.lock:
+            prompted = self.dialogue.prompt()
+        if prompted:
+            self._changed()
+            return None
+
+        self._set_status("listening")
+        cmd = voice.listen(timeout=LISTEN_SLICE, on_partial=self.dialogue.prefetch_from_partial)
+        if not cmd:
+            return None
+        self.log("User", cmd)
+        self._set_status("working")
+        return cmd, self.dialogue.parse(cmd)
+
+    def _wait_for_reply(self):
+        """
+        Waits for the reply being spoken to finish, listening for "stop"/"cancel" meanwhile
+        (same barge-in as read_aloud, so long summaries and reply lists can be cut short).
+        Returns the interrupting phrase, or None once the reply has finished.
+        """
+        keywords = queue.Queue()
+        spotting = voice.keyword_spotting_ready()
+        unsubscribe_keywords = voice.on_keyword(keywords.put)
+        deadline = time.time() + REPLY_WAIT
+        try:
+            while voice.is_speaking() and time.time() < deadline and not self._stopping.is_set():
+                if spotting:
+                    try:
+                        return keywords.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                # Only speech well above the calibrated room level counts while the assistant is talking
+                cmd = voice.listen(timeout=0.5, phrase_time_limit=1.5, adjust_noise=False,
+                                   energy_threshold=voice.barge_in_threshold())
+                if cmd and ("stop" in cmd.lower() or "cancel" in cmd.lower()):
+                    return cmd
+        finally:
+            unsubscribe_keywords()
+        return None
+
+    def _read_selected(self):
+        idx = self.state.selected_email
+        with self.lock:
+            self.state.auto_read = False
+        if not 0 <= idx < len(self.state.emails):
+            return
+        self.dialogue.get_email_body(idx)
+        self._changed()
+        self.read_aloud(self.dialogue.reading_text(idx))
+
+    def _refresh(self):
+        s = self.state
+        if s.compose_mode or s.current_folder == "Settings" or s.last_fetched_folder == s.current_folder:
+            return
+        self._set_status("fetching")
+        # Not under the lock: the page keeps rendering ("Fetching...") during the IMAP round trip
+        if self.dialogue.refresh_folder():
+            self._changed()